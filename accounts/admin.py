@@ -5,7 +5,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.core.exceptions import ValidationError
 
-from accounts.models import Account
+from accounts.models import Account, OutboundEmail
 
 
 class UserCreationForm(forms.ModelForm):
@@ -75,8 +75,15 @@ class UserAdmin(BaseUserAdmin):
     filter_horizontal = ()
 
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to',)
+
+
 # Now register the new UserAdmin...
 admin.site.register(Account, UserAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
 # ... and, since we're not using Django's built-in permissions,
 # unregister the Group model from admin.
 admin.site.unregister(Group)
\ No newline at end of file
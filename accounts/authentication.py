@@ -0,0 +1,121 @@
+"""
+JWT authentication without an account query on every request.
+
+The fields the views need from request.user are kept in a small LRU
+cache of every process for JWT_PRINCIPAL_CACHE_TTL seconds, and evicted
+when the account is saved or deleted. request.user is an Account with
+only these fields loaded, the others are fetched if something reads them.
+
+With JWT_EMBED_PRINCIPAL the fields are also written in the access tokens
+and trusted as they are, so even a cache miss doesn't query the account.
+They are read again from the account on every refresh, so deactivations
+and demotions apply once the access tokens expire.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Account
+
+PRINCIPAL_FIELDS = ('id', 'username', 'name', 'is_staff', 'is_active')
+PRINCIPAL_CLAIM = 'principal'
+
+
+class PrincipalCache:
+    """LRU cache of at most ``maxsize`` entries expiring after ``ttl`` seconds."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + getattr(settings, 'JWT_PRINCIPAL_CACHE_TTL', 60)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > getattr(settings, 'JWT_PRINCIPAL_CACHE_SIZE', 1024):
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principals = PrincipalCache()
+
+
+def get_principal(account):
+    return {field: getattr(account, field) for field in PRINCIPAL_FIELDS}
+
+
+def principal_to_account(principal):
+    # the other fields are deferred, loaded on access like with only()
+    fields = [field.attname for field in Account._meta.concrete_fields if field.attname in principal]
+    return Account.from_db(None, fields, [principal[field] for field in fields])
+
+
+def load_principal(user_id):
+    try:
+        return Account.objects.values(*PRINCIPAL_FIELDS).get(**{api_settings.USER_ID_FIELD: user_id})
+    except Account.DoesNotExist:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+
+# access tokens only, the refresh tokens would carry the fields over
+def embed_principal(access_token, principal):
+    if getattr(settings, 'JWT_EMBED_PRINCIPAL', False):
+        access_token[PRINCIPAL_CLAIM] = principal
+    return access_token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        principal = None
+        if getattr(settings, 'JWT_EMBED_PRINCIPAL', False):
+            principal = validated_token.get(PRINCIPAL_CLAIM)
+        if principal is None:
+            principal = principals.get(user_id)
+        if principal is None:
+            principal = load_principal(user_id)
+            principals.set(user_id, principal)
+
+        if not principal['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return principal_to_account(principal)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def evict_principal(sender, instance, **kwargs):
+    # other processes see the change once their entry expires
+    principals.delete(getattr(instance, api_settings.USER_ID_FIELD))
@@ -1,18 +1,29 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
 
 class EmailBackend(ModelBackend):
+    """Log in with the email, in any case, or the username."""
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            try:
-                user = UserModel.objects.get(email=username)    
-            except :
-                user = UserModel.objects.get(username=username)
-            
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # one query for both, an exact email match wins over case variants
+        # and over another account using the email as its username
+        users = UserModel._default_manager.filter(Q(email__iexact=username) | Q(username=username))
+        users = sorted(users[:3], key=lambda user: (user.email != username, user.email.lower() != username.lower()))
+
+        if not users:
+            # hashing anyway, so missing accounts take as long as wrong passwords
+            UserModel().set_password(password)
             return None
-        else:
-            if user.check_password(password):
-                return user
-        return None
\ No newline at end of file
+
+        user = users[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import Account
+from core.bench import BenchCommand, QueryCounter, rolled_back
+
+
+class LegacyEmailBackend(ModelBackend):
+    # the previous backend, a second query when the email doesn't match
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        username = username or kwargs.get(UserModel.USERNAME_FIELD)
+        try:
+            try:
+                user = UserModel.objects.get(email=username)
+            except Exception:
+                user = UserModel.objects.get(username=username)
+        except UserModel.DoesNotExist:
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+
+class Command(BenchCommand):
+    help = 'Measure the throughput of /accounts/login/ by email and by username'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--fast-hasher', action='store_true',
+            help='hash with MD5 so the timings show the lookups rather than PBKDF2')
+
+    def bench(self, *args, **options):
+        hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if options['fast_hasher'] else None
+        backends = (
+            ('legacy', 'accounts.management.commands.bench_login.LegacyEmailBackend'),
+            ('single query', 'accounts.backends.EmailBackend'),
+        )
+
+        self.stdout.write('{:>14} {:>10} {:>10} {:>10} {:>10}'.format('backend', 'login', 'req/s', 'ms/req', 'queries'))
+        for name, backend in backends:
+            changes = {'AUTHENTICATION_BACKENDS': [backend]}
+            if hashers:
+                changes['PASSWORD_HASHERS'] = hashers
+            # a fresh account for each backend, last_login included
+            with override_settings(**changes), rolled_back():
+                Account.objects.create_user(email='bench-login@example.com', username='bench-login', password='password')
+                for login in ('bench-login@example.com', 'bench-login'):
+                    self.stdout.write('{:>14} {:>10} {:>10.1f} {:>10.2f} {:>10.1f}'.format(
+                        name, 'email' if '@' in login else 'username', *self.measure(login, options['requests'])))
+
+    def measure(self, login, requests):
+        client = Client(HTTP_HOST='localhost')
+        url = reverse('token_create')
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for _ in range(requests):
+                response = client.post(url, {'email': login, 'password': 'password'})
+                assert response.status_code == 200, response.content
+        elapsed = time.perf_counter() - start
+        return requests / elapsed, elapsed * 1000 / requests, counter.count / requests
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import OutboundEmail
+from accounts.outbox import send_queued_email
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails that are due, e.g. left behind by a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='also retry the emails that gave up')
+        parser.add_argument('--batch-size', type=int, help='emails claimed at once')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            OutboundEmail.objects.filter(status=OutboundEmail.FAILED).update(status=OutboundEmail.PENDING, attempts=0)
+
+        sent = send_queued_email(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Sent {} email(s)'.format(sent)))
+
+        remaining = OutboundEmail.objects.filter(status=OutboundEmail.PENDING).count()
+        if remaining:
+            self.stdout.write('{} email(s) waiting for a retry'.format(remaining))
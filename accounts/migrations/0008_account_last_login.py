@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='last_login',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,9 @@
 import optparse
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 
 
@@ -36,7 +40,8 @@ class Account(AbstractBaseUser):
     username     = models.CharField(max_length=40,unique=True,null=True,blank=True)
     password     = models.CharField(max_length=128)
     date_joined  = models.DateTimeField(auto_now_add=True)
-    last_login   = models.DateTimeField(auto_now=True)
+    # set on authentication only, see record_login()
+    last_login   = models.DateTimeField(null=True, blank=True)
     is_admin     = models.BooleanField(default=False)
     is_active    = models.BooleanField(default=True)
     is_staff     = models.BooleanField(default=False)
@@ -55,6 +60,23 @@ class Account(AbstractBaseUser):
     def __str__(self):
         return self.email
     
+    def record_login(self):
+        """
+        Set last_login, at most once per LAST_LOGIN_UPDATE_INTERVAL seconds.
+
+        Returns whether the row was written.
+        """
+        now = timezone.now()
+        since = now - timedelta(seconds=getattr(settings, 'LAST_LOGIN_UPDATE_INTERVAL', 600))
+        if self.last_login and self.last_login > since:
+            return False
+        # conditional, concurrent logins write the row once
+        updated = Account.objects.filter(
+            models.Q(last_login__isnull=True) | models.Q(last_login__lte=since), pk=self.pk,
+        ).update(last_login=now)
+        self.last_login = now
+        return bool(updated)
+
     def has_perm(self, perm, obj=None):
         return self.is_admin
     
@@ -62,3 +84,35 @@ class Account(AbstractBaseUser):
         return True
      
 
+
+
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # when the email is due, or when the claim of a sender expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return '{} to {}'.format(self.subject, self.to)
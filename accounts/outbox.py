@@ -0,0 +1,143 @@
+"""
+Outbox of the emails sent by the account endpoints.
+
+Emails are stored in the OutboundEmail table by the request and sent
+once it commits by a single background thread, which delivers everything
+due over one SMTP connection. Failed sends are retried with an exponential
+backoff. The status column is the job state: emails left behind by a
+restart are sent by the send_queued_email command.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# seconds after which an email claimed by a sender that died is due again
+CLAIM_TIMEOUT = 300
+
+_executor = None
+_retry_timer = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # a single sender, the emails share its SMTP connection
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email-outbox')
+    return _executor
+
+
+def enqueue_email(to, subject, body):
+    email = OutboundEmail.objects.create(to=to, subject=subject, body=body)
+    if not getattr(settings, 'EMAIL_OUTBOX_ASYNC', True):
+        send_queued_email()
+        return email
+    # the sender must see the committed row
+    transaction.on_commit(wake_sender)
+    return email
+
+
+def wake_sender():
+    get_executor().submit(_run_in_worker)
+
+
+def _run_in_worker():
+    try:
+        send_queued_email()
+        _schedule_retry()
+    except Exception:
+        logger.exception('Sending the queued emails failed')
+    finally:
+        # the sender thread outlives requests, don't keep its connection open
+        connection.close()
+
+
+def _schedule_retry():
+    global _retry_timer
+    due = (OutboundEmail.objects.filter(status=OutboundEmail.PENDING)
+           .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first())
+    if due is None:
+        return
+    with _lock:
+        if _retry_timer is not None:
+            _retry_timer.cancel()
+        _retry_timer = threading.Timer(max((due - timezone.now()).total_seconds(), 0), wake_sender)
+        _retry_timer.daemon = True
+        _retry_timer.start()
+
+
+def claim_due_emails(batch_size):
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        status__in=[OutboundEmail.PENDING, OutboundEmail.SENDING], next_attempt_at__lte=now)
+    email_ids = list(due.order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+
+    # another sender may claim the same emails, ours carry our expiry
+    expires_at = now + timedelta(seconds=CLAIM_TIMEOUT)
+    due.filter(pk__in=email_ids).update(status=OutboundEmail.SENDING, next_attempt_at=expires_at)
+    return list(OutboundEmail.objects.filter(
+        pk__in=email_ids, status=OutboundEmail.SENDING, next_attempt_at=expires_at))
+
+
+def retry_later(email, error):
+    attempts = email.attempts + 1
+    changes = {'attempts': attempts, 'last_error': str(error)}
+    if attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        logger.error('Giving up on email %s to %s: %s', email.pk, email.to, error)
+        changes['status'] = OutboundEmail.FAILED
+    else:
+        delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+        changes['status'] = OutboundEmail.PENDING
+        changes['next_attempt_at'] = timezone.now() + timedelta(seconds=delay)
+    OutboundEmail.objects.filter(pk=email.pk).update(**changes)
+
+
+def send_queued_email(batch_size=None):
+    """
+    Send the emails that are due over a single mail connection.
+
+    Returns the number of emails sent.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    mail_connection = get_connection(fail_silently=False)
+    sent = 0
+    try:
+        while True:
+            emails = claim_due_emails(batch_size)
+            if not emails:
+                return sent
+
+            for index, email in enumerate(emails):
+                try:
+                    # opened once, or again after a failure closed it
+                    mail_connection.open()
+                except Exception as error:
+                    # the server is unreachable, the whole batch waits
+                    for email in emails[index:]:
+                        retry_later(email, error)
+                    return sent
+
+                message = EmailMessage(email.subject, email.body, to=[email.to], connection=mail_connection)
+                try:
+                    mail_connection.send_messages([message])
+                except Exception as error:
+                    retry_later(email, error)
+                    mail_connection.close()
+                else:
+                    OutboundEmail.objects.filter(pk=email.pk).update(
+                        status=OutboundEmail.SENT, attempts=email.attempts + 1, sent_at=timezone.now())
+                    sent += 1
+    finally:
+        mail_connection.close()
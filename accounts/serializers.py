@@ -1,24 +1,44 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
+from accounts.authentication import embed_principal, get_principal, load_principal
 from accounts.models import Account
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
-    
+
     def validate(self,attrs):
         
         data = super().validate(attrs)
         
         refresh = self.get_token(self.user)
         data['refresh'] = str(refresh)
-        data['access'] = str(refresh.access_token)
+        data['access'] = str(embed_principal(refresh.access_token, get_principal(self.user)))
         data['username'] = self.user.username
         data['name'] = self.user.name
         data['email'] = self.user.email
 
+        self.user.record_login()
         return data
     
+class PrincipalTokenRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if getattr(settings, 'JWT_EMBED_PRINCIPAL', False):
+            # the embedded fields are read again, not copied from the refresh token
+            access = AccessToken(data['access'], verify=False)
+            principal = load_principal(access[api_settings.USER_ID_CLAIM])
+            if not principal['is_active']:
+                raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+            data['access'] = str(embed_principal(access, principal))
+        return data
+
 class AccountSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     is_active = serializers.BooleanField(read_only=True)
@@ -57,6 +77,15 @@ class AccountUpdateSerializer(serializers.ModelSerializer):
             'address',
         )
 
+    def update(self, instance, validated_data):
+        # writing only the fields that changed, if any
+        changed = [field for field, value in validated_data.items() if getattr(instance, field) != value]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        if changed:
+            instance.save(update_fields=changed)
+        return instance
+
 
 class VerifyOTPSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -1,3 +1,300 @@
-from django.test import TestCase
+import re
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from blogs.models import Blog, Category
+from .authentication import PRINCIPAL_CLAIM, CachedJWTAuthentication, principals
+from .models import Account, OutboundEmail
+from .outbox import enqueue_email, send_queued_email
+
+
+class CountingBackend(LocmemBackend):
+    """Locmem backend counting the connections opened, like SMTP would."""
+
+    opened = 0
+
+    def open(self):
+        if getattr(self, 'connection', None):
+            return False
+        CountingBackend.opened += 1
+        self.connection = True
+        return True
+
+    def close(self):
+        self.connection = None
+
+
+class FailingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise SMTPException('Mail server unavailable')
+
+
+class AccountTestCase(TestCase):
+    def setUp(self):
+        # ids are reused once the test transactions roll back
+        principals.clear()
+        self.client = APIClient()
+
+    def create_account(self, username='author', **fields):
+        account = Account.objects.create_user(
+            email='{}@example.com'.format(username), username=username, password='password')
+        Account.objects.filter(pk=account.pk).update(**fields)
+        account.refresh_from_db()
+        return account
+
+
+@override_settings(EMAIL_OUTBOX_ASYNC=False)
+class OutboundEmailTests(AccountTestCase):
+    def test_register_otp_is_sent(self):
+        account = self.create_account(is_active=False)
+        response = self.client.get(reverse('send-verification-otp'), {'email': account.email})
+        self.assertEqual(response.status_code, 200)
+
+        account.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [account.email])
+        self.assertIn(account.otp, mail.outbox[0].body)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=True)
+    def test_request_only_queues_the_email(self):
+        account = self.create_account()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(reverse('send-reset-password-otp'), {'email': account.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.PENDING)
+
+        self.assertEqual(send_queued_email(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=True, EMAIL_BACKEND='accounts.tests.CountingBackend')
+    def test_batch_shares_one_connection(self):
+        CountingBackend.opened = 0
+        for i in range(5):
+            enqueue_email('user{}@example.com'.format(i), 'Subject', 'Body')
+        self.assertEqual(send_queued_email(batch_size=2), 5)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=True, EMAIL_BACKEND='accounts.tests.FailingBackend',
+                       EMAIL_OUTBOX_RETRY_DELAY=10, EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+    def test_failures_are_retried_with_backoff(self):
+        email = enqueue_email('user@example.com', 'Subject', 'Body')
+        delays = []
+        for _ in range(2):
+            before = timezone.now()
+            send_queued_email()
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboundEmail.PENDING)
+            delays.append(round((email.next_attempt_at - before).total_seconds()))
+            # not due yet
+            self.assertEqual(send_queued_email(), 0)
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(delays, [10, 20])
+        self.assertIn('Mail server unavailable', email.last_error)
+
+        with self.assertLogs('accounts.outbox', 'ERROR'):
+            send_queued_email()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 3))
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=True)
+    def test_expired_claims_are_sent_again(self):
+        email = enqueue_email('user@example.com', 'Subject', 'Body')
+        # claimed by a sender that died
+        OutboundEmail.objects.update(
+            status=OutboundEmail.SENDING, next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(send_queued_email(), 0)
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_email(), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=True)
+    def test_command_sends_the_queued_emails(self):
+        enqueue_email('user@example.com', 'Subject', 'Body')
+        OutboundEmail.objects.create(to='other@example.com', subject='Subject', body='Body', status=OutboundEmail.FAILED)
+
+        out = StringIO()
+        call_command('send_queued_email', '--retry-failed', stdout=out)
+        self.assertIn('Sent 2 email(s)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class EmailBackendTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+
+    def login(self, login, password='password'):
+        return self.client.post(reverse('token_create'), {'email': login, 'password': password})
+
+    def test_login_with_email_or_username(self):
+        for login in ('author@example.com', 'Author@Example.com', 'author'):
+            response = self.login(login)
+            self.assertEqual(response.status_code, 200, login)
+            self.assertEqual(response.data['username'], 'author')
+
+    def test_lookup_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='author', password='password'), self.account)
+
+    def test_exact_email_wins(self):
+        other = self.create_account('other')
+        Account.objects.filter(pk=other.pk).update(username='author@example.com')
+        self.assertEqual(authenticate(username='author@example.com', password='password'), self.account)
+
+    def test_rejected_logins(self):
+        Account.objects.filter(pk=self.account.pk).update(is_active=False)
+        self.assertEqual(self.login('author').status_code, 401)
+        self.assertEqual(self.login('author@example.com', 'wrong').status_code, 401)
+
+    def test_missing_account_still_hashes(self):
+        with mock.patch.object(Account, 'set_password') as set_password:
+            self.assertIsNone(authenticate(username='nobody', password='password'))
+        set_password.assert_called_once_with('password')
+
+
+class AccountWriteTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+
+    def capture_updates(self, func):
+        with CaptureQueriesContext(connection) as context:
+            response = func()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "accounts_account"')]
+        return response, [re.findall(r'"(\w+)" = ', update.split(' WHERE ')[0]) for update in updates]
+
+    @override_settings(EMAIL_OUTBOX_ASYNC=False)
+    def test_otp_writes_only_the_otp(self):
+        response, updates = self.capture_updates(
+            lambda: self.client.get(reverse('send-reset-password-otp'), {'email': self.account.email}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updates, [['otp']])
+        self.account.refresh_from_db()
+        self.assertIsNone(self.account.last_login)
+
+    def test_profile_update_writes_the_changed_fields(self):
+        url = reverse('account', args=['author'])
+        data = {'username': 'author', 'name': 'Author', 'phone': '', 'address': ''}
+        response, updates = self.capture_updates(lambda: self.client.put(url, data))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updates, [['name']])
+
+        response, updates = self.capture_updates(lambda: self.client.put(url, data))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updates, [])
+
+    @override_settings(LAST_LOGIN_UPDATE_INTERVAL=600)
+    def test_login_records_last_login_once_per_interval(self):
+        login = {'email': 'author', 'password': 'password'}
+        response, updates = self.capture_updates(lambda: self.client.post(reverse('token_create'), login))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updates, [['last_login']])
+        self.account.refresh_from_db()
+        self.assertIsNotNone(self.account.last_login)
+
+        _, updates = self.capture_updates(lambda: self.client.post(reverse('token_create'), login))
+        self.assertEqual(updates, [])
+
+        Account.objects.update(last_login=timezone.now() - timedelta(minutes=11))
+        _, updates = self.capture_updates(lambda: self.client.post(reverse('token_create'), login))
+        self.assertEqual(updates, [['last_login']])
+
+
+class CachedJWTAuthenticationTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account(name='Author')
+        blog = Blog.objects.create(
+            title='Hello', body='body', author=self.account, category=Category.objects.create(name='History'))
+        self.url = reverse('blog-like', args=[blog.slug])
+
+    def authenticate(self):
+        response = self.client.post(reverse('token_create'), {'email': 'author', 'password': 'password'})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(response.data['access']))
+        return response.data['access']
+
+    def count_account_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            response = func()
+        return response, sum('FROM "accounts_account"' in query['sql'] for query in context.captured_queries)
+
+    def test_account_is_loaded_once(self):
+        self.authenticate()
+        _, queries = self.count_account_queries(lambda: self.client.put(self.url))
+        self.assertEqual(queries, 1)
+        response, queries = self.count_account_queries(lambda: self.client.delete(self.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+
+    def test_other_fields_are_loaded_on_access(self):
+        token = self.authenticate()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer {}'.format(token))
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.username, user.name), (self.account.pk, 'author', 'Author'))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'author@example.com')
+
+    def test_deactivation_evicts_the_account(self):
+        self.authenticate()
+        self.client.put(self.url)
+        self.account.is_active = False
+        self.account.save(update_fields=['is_active'])
+        self.assertEqual(self.client.put(self.url).status_code, 401)
+
+    def test_entries_expire(self):
+        self.authenticate()
+        self.client.put(self.url)
+        with override_settings(JWT_PRINCIPAL_CACHE_TTL=-1):
+            principals.set(self.account.pk, principals.get(self.account.pk))
+        _, queries = self.count_account_queries(lambda: self.client.put(self.url))
+        self.assertEqual(queries, 1)
+
+    @override_settings(JWT_PRINCIPAL_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        for key in range(3):
+            principals.set(key, {})
+        self.assertIsNone(principals.get(0))
+        self.assertEqual(principals.get(2), {})
+
+    @override_settings(JWT_EMBED_PRINCIPAL=True)
+    def test_embedded_principal_skips_the_lookup(self):
+        token = self.authenticate()
+        self.assertEqual(AccessToken(token)[PRINCIPAL_CLAIM]['username'], 'author')
+        response, queries = self.count_account_queries(lambda: self.client.put(self.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+
+    @override_settings(JWT_EMBED_PRINCIPAL=True)
+    def test_embedded_principal_is_read_again_on_refresh(self):
+        login = self.client.post(reverse('token_create'), {'email': 'author', 'password': 'password'})
+        self.assertNotIn(PRINCIPAL_CLAIM, RefreshToken(login.data['refresh']))
+
+        Account.objects.filter(pk=self.account.pk).update(is_staff=True)
+        response = self.client.post(reverse('token_refresh'), {'refresh': login.data['refresh']})
+        self.assertTrue(AccessToken(response.data['access'])[PRINCIPAL_CLAIM]['is_staff'])
+        self.assertNotIn(PRINCIPAL_CLAIM, RefreshToken(response.data['refresh']))
+
+        self.account.is_active = False
+        self.account.save(update_fields=['is_active'])
+        response = self.client.post(reverse('token_refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, 401)
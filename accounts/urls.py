@@ -1,7 +1,6 @@
 from django.urls import path
 
 from . import views
-from rest_framework_simplejwt import views as jwt_views
 
 urlpatterns = [
      path('register/', views.RegisterView.as_view(), name='register'),
@@ -16,7 +15,7 @@ urlpatterns = [
           views.CustomTokenObtainPairView.as_view(), 
           name='token_create'),  # override sjwt stock token
      path('token/refresh/', 
-          jwt_views.TokenRefreshView.as_view(), 
+          views.PrincipalTokenRefreshView.as_view(), 
           name='token_refresh'),
 
      path('<str:username>/', views.AccountDetailView.as_view(), name='account'),
@@ -1,7 +1,8 @@
-from django.core.mail import EmailMessage
 from django.conf import settings
 import jwt
 
+from .outbox import enqueue_email
+
 
 class Util:
     @staticmethod
@@ -11,13 +12,8 @@ class Util:
             'subject': 'Verify your email address',
             'body': f'This mail is sent to you because you have just signed up for Digital Museum \n \n Your otp is: \n\n {otp}'
         }
-        # Send email
-        email = EmailMessage(
-            subject=data['subject'],
-            body=data['body'],
-            to=[data['to']],
-        )
-        email.send()
+        # Queue the email, it is sent in the background once the request commits
+        enqueue_email(data['to'], data['subject'], data['body'])
 
     @staticmethod
     def jwt_encode(payload):
@@ -1,16 +1,18 @@
 import jwt
+from django.db import transaction
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 import random
 
 from .serializers import (
     AccountSerializer, 
     CustomTokenObtainPairSerializer, 
+    PrincipalTokenRefreshSerializer,
     VerifyOTPSerializer,
     AccountUpdateSerializer
 )
@@ -20,6 +22,9 @@ from .utils import Util
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+class PrincipalTokenRefreshView(TokenRefreshView):
+    serializer_class = PrincipalTokenRefreshSerializer
+
 @permission_classes((AllowAny,))
 class RegisterView(APIView):
     def post(self, request):   
@@ -52,13 +57,12 @@ class SendRegisterOTP(APIView):
         if account.is_active:
             return Response({'error':'Account is already active'},status=400)
         
-        # generate random 6 digit otp and send it to email
+        # generate random 6 digit otp, save it in account and queue the email
         otp = random.randint(100000, 999999)
-        Util.send_otp_vai_email(otp,email)
-
-        # save otp in account
-        account.otp = otp        
-        account.save()
+        with transaction.atomic():
+            account.otp = otp
+            account.save(update_fields=['otp'])
+            Util.send_otp_vai_email(otp,email)
 
         return Response({'success':'OTP sent to your email'},status=200)
 
@@ -82,7 +86,7 @@ class VerifyRegisterOTP(APIView):
             
         if account.otp == otp:
             account.is_active = True
-            account.save()
+            account.save(update_fields=['is_active'])
             return Response({
                 'success':'Account verified successfully',
                 'token':str(RefreshToken.for_user(account).access_token),
@@ -101,13 +105,12 @@ class SendResetPasswordOTP(APIView):
         except Account.DoesNotExist:
             return Response({'error':"Account does not exist"},status=400)
         
-        # generate random 6 digit otp and send it to email
+        # generate random 6 digit otp, save it in account and queue the email
         otp = random.randint(100000, 999999)
-        Util.send_otp_vai_email(otp,email)
-
-        # save otp in account
-        account.otp = otp        
-        account.save()
+        with transaction.atomic():
+            account.otp = otp
+            account.save(update_fields=['otp'])
+            Util.send_otp_vai_email(otp,email)
 
         return Response({'success':'OTP sent to your email'},status=200)
 
@@ -158,7 +161,7 @@ class ResetPasswordView(APIView):
         password = request.data.get('password')
 
         account.set_password(password)
-        account.save()
+        account.save(update_fields=['password'])
 
         return Response({'success':'Password reset successfully'},status=200)
     
@@ -0,0 +1,212 @@
+"""
+Async variants of the blog read, like and comment endpoints.
+
+Under ASGI (config/asgi.py) every DRF view is run in a thread, DRF 3.14
+views being synchronous. With ASYNC_BLOG_VIEWS the urls route these plain
+Django async views instead. They reuse the serializers, paginations,
+response cache and validators of views.py and read through the async ORM
+(aget, acount, async iteration).
+
+The JWT authentication, the response cache and the write transactions
+have no async API in Django 4.2 and run through sync_to_async. Methods
+without an async variant (blog writes) are handed to the DRF views.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from accounts.authentication import CachedJWTAuthentication
+from config.renderers import FastJSONParser, FastJSONRenderer
+from .models import Blog, Comment
+from .paginations import CustomLimitOffsetPagination, BlogCursorPagination, CommentCursorPagination
+from .serializers import BlogListSerializer, BlogDetailSerializer, CommentSerializer
+from . import cache, views
+from .conditional import async_conditional, blog_list_validators, blog_detail_validators
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    # a Response finalized like APIView does, rendered by the handler
+    response = Response(data, status=status)
+    response.accepted_renderer = FastJSONRenderer()
+    response.accepted_media_type = FastJSONRenderer.media_type
+    response.renderer_context = {}
+    return response
+
+
+def blog_not_found(slug):
+    return json_response(
+        {'error': 'Blog with slug {} does not exist'.format(slug)}, status=status.HTTP_404_NOT_FOUND)
+
+
+def _cached_response_data(cache_key, request, *args):
+    key = cache_key(request, *args) if cache.is_cacheable(request) else None
+    return key, cache.get_response_data(key) if key else None
+
+
+class AsyncAPIView(View):
+    """
+    The part of APIView the async endpoints need: JWT authentication,
+    parsed request data and JSON responses.
+    """
+
+    # DRF view serving the methods that have no async handler
+    fallback = None
+    # methods refused to anonymous users
+    authenticated_methods = ()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # authenticated with tokens, not cookies, like APIView
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = None
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), None)
+        if not asyncio.iscoroutinefunction(handler):
+            if self.fallback is not None:
+                return await sync_to_async(self.fallback.as_view())(request, *args, **kwargs)
+            return self.http_method_not_allowed(request, *args, **kwargs)
+
+        request = Request(
+            request,
+            parsers=[FastJSONParser(), FormParser(), MultiPartParser()],
+            authenticators=[CachedJWTAuthentication()],
+        )
+        # request.user authenticates on first access, which may query
+        try:
+            await sync_to_async(getattr)(request, 'user')
+        except APIException as error:
+            return json_response({'detail': error.detail}, status=error.status_code)
+
+        if request.method in self.authenticated_methods and not request.user.is_authenticated:
+            return json_response(
+                {'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        return await handler(request, *args, **kwargs)
+
+
+class BlogListView(AsyncAPIView):
+    fallback = views.BlogListView
+
+    @async_conditional(blog_list_validators)
+    async def get(self, request):
+        # serving anonymous readers from the response cache
+        cache_key, data = await sync_to_async(_cached_response_data)(cache.feed_cache_key, request)
+        if data is not None:
+            return json_response(data)
+
+        try:
+            fields = BlogListSerializer.select_fields(
+                request.query_params.get('fields'),
+                request.query_params.get('exclude'),
+                request.query_params.get('excerpt') in ('1', 'true'),
+            )
+        except ValueError as error:
+            return json_response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = await Blog.objects.for_list().afor_feed(
+            category=request.query_params.get('category'), username=request.query_params.get('username'))
+        queryset = queryset.defer(*[name for name in ('body', 'excerpt') if name not in fields])
+        if 'images' not in fields:
+            queryset = queryset.prefetch_related(None)
+
+        if BlogCursorPagination.is_requested(request):
+            # the keyset queries of CursorPagination are synchronous
+            paginator = BlogCursorPagination()
+            blogs = await sync_to_async(paginator.paginate_queryset)(queryset, request)
+        else:
+            paginator = CustomLimitOffsetPagination()
+            blogs = await paginator.apaginate_queryset(queryset, request)
+
+        serializer = BlogListSerializer(blogs, many=True, fields=fields, context={'request': request})
+        data = paginator.get_paginated_response(serializer.data).data
+        if cache_key:
+            await sync_to_async(cache.set_response_data)(cache_key, data)
+        return json_response(data)
+
+
+class BlogDetailView(AsyncAPIView):
+    fallback = views.BlogDetailView
+
+    @async_conditional(blog_detail_validators)
+    async def get(self, request, slug):
+        cache_key, data = await sync_to_async(_cached_response_data)(cache.detail_cache_key, request, slug)
+        if data is not None:
+            return json_response(data)
+
+        try:
+            blog = await Blog.objects.for_list().aget(slug=slug)
+        except Blog.DoesNotExist:
+            return blog_not_found(slug)
+
+        # the first page of comments is embedded by the serializer
+        serializer = BlogDetailSerializer(blog, context={'request': request})
+        data = await sync_to_async(lambda: serializer.data)()
+        if cache_key:
+            await sync_to_async(cache.set_response_data)(cache_key, data)
+        return json_response(data)
+
+
+class BlogLikeView(AsyncAPIView):
+    authenticated_methods = ('POST', 'PUT', 'DELETE')
+
+    async def post(self, request, slug):
+        return await self.change_like(request, slug)
+
+    async def put(self, request, slug):
+        return await self.change_like(request, slug, liked=True)
+
+    async def delete(self, request, slug):
+        return await self.change_like(request, slug, liked=False)
+
+    async def change_like(self, request, slug, liked=None):
+        blog_id = await Blog.objects.filter(slug=slug).values_list('id', flat=True).afirst()
+        if blog_id is None:
+            return blog_not_found(slug)
+
+        liked, like_count = await sync_to_async(views.change_like)(blog_id, request.user, liked)
+        return json_response({'liked': liked, 'like_count': like_count})
+
+
+class BlogCommentListView(AsyncAPIView):
+    async def get(self, request, slug):
+        blog_id = await Blog.objects.filter(slug=slug).values_list('id', flat=True).afirst()
+        if blog_id is None:
+            return blog_not_found(slug)
+
+        paginator = CommentCursorPagination()
+        comments = await sync_to_async(paginator.paginate_queryset)(
+            Comment.objects.filter(blog_id=blog_id).select_related('account'), request)
+        return json_response(paginator.get_paginated_response(CommentSerializer(comments, many=True).data).data)
+
+
+class BlogCommentView(AsyncAPIView):
+    authenticated_methods = ('POST',)
+
+    async def post(self, request, slug):
+        try:
+            blog = await Blog.objects.aget(slug=slug)
+        except Blog.DoesNotExist:
+            return blog_not_found(slug)
+
+        serializer = CommentSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # saving the comment and bumping the blog's comment_count atomically
+        @sync_to_async
+        def save():
+            with transaction.atomic():
+                serializer.save(blog=blog, account=request.user)
+            return serializer.data
+        return json_response(await save())
@@ -0,0 +1,112 @@
+"""
+Response cache of the public blog endpoints.
+
+Cached responses are keyed on the versions of the scopes they depend on:
+
+    all                 every response (category renames, author names)
+    feed                the unfiltered feed
+    category:<name>     feeds filtered by the category
+    author:<username>   feeds filtered by the author
+    blog:<slug>         the detail response of the blog
+
+Invalidating a scope replaces its version, so only the responses that
+depend on it are evicted; the stale entries simply expire.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.routers import reads_from_replica
+
+# query parameters the feed responses depend on, anything else is ignored
+FEED_CACHE_PARAMS = (
+    'category', 'username', 'limit', 'offset', 'pagination', 'cursor', 'fields', 'exclude', 'excerpt',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'BLOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    timeout = getattr(settings, 'BLOG_CACHE_TIMEOUT', 300)
+    if reads_from_replica():
+        # read from a lagging replica, the response may be stored under the
+        # version a write just rotated in, keep it no longer than the
+        # replicas take to catch up
+        return min(timeout, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+    return timeout
+
+
+def _version_key(scope):
+    return 'blogs:version:{}'.format(scope)
+
+
+def _versions(cache, scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # an evicted version gets a fresh value, never an old one
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _cache_key(kind, request, scopes, parts):
+    cache = get_cache()
+    # absolute urls (images, pagination links) depend on the host
+    parts = [request.build_absolute_uri('/')] + list(parts) + _versions(cache, ('all',) + scopes)
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return 'blogs:{}:{}'.format(kind, digest)
+
+
+def is_cacheable(request):
+    return request.method == 'GET' and not request.user.is_authenticated
+
+
+def feed_scopes(params):
+    category = params.get('category')
+    username = params.get('username')
+
+    scopes = ()
+    if category:
+        scopes += ('category:{}'.format(category),)
+    if username:
+        scopes += ('author:{}'.format(username),)
+    return scopes or ('feed',)
+
+
+def feed_cache_key(request):
+    params = request.query_params
+    return _cache_key('feed', request, feed_scopes(params), [params.get(name) for name in FEED_CACHE_PARAMS])
+
+
+def detail_cache_key(request, slug):
+    return _cache_key('detail', request, ('blog:{}'.format(slug),), [slug])
+
+
+def get_response_data(key):
+    return get_cache().get(key)
+
+
+def set_response_data(key, data):
+    get_cache().set(key, data, get_timeout())
+
+
+def invalidate(*scopes):
+    get_cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def blog_scopes(slug, category, username):
+    scopes = ['feed', 'blog:{}'.format(slug), 'category:{}'.format(category)]
+    if username:
+        scopes.append('author:{}'.format(username))
+    return scopes
+
+
+def invalidate_all():
+    invalidate('all')
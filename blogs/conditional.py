@@ -0,0 +1,125 @@
+"""
+Validators for conditional GET requests on the blog endpoints.
+
+They are computed with a single aggregate query, without serializing the
+response, and used with django.views.decorators.http.condition so repeat
+readers get a 304 when nothing changed.
+"""
+
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import Blog, Category
+from . import cache
+
+
+def _etag(*parts):
+    # weak, the validators describe the data and not the exact bytes
+    return 'W/"{}"'.format(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def _validators(cache_key=None):
+    """
+    condition() asks for the etag and last-modified separately, compute them
+    once per request. For anonymous readers they are cached next to the
+    response, under the same scope versions, so cache hits stay query-free.
+    """
+    def decorator(compute):
+        def validators(request, *args, **kwargs):
+            if not hasattr(request, '_validators'):
+                key = None
+                if cache_key is not None and cache.is_cacheable(request):
+                    key = cache_key(request, *args, **kwargs) + ':validators'
+                result = cache.get_response_data(key) if key else None
+                if result is None:
+                    result = compute(request, *args, **kwargs)
+                    if key:
+                        cache.set_response_data(key, result)
+                request._validators = result
+            return request._validators
+        return validators
+    return decorator
+
+
+def conditional(validators):
+    """Decorate an APIView/ViewSet method to answer If-None-Match/If-Modified-Since."""
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+    ))
+
+
+def async_conditional(validators):
+    """
+    conditional() for the handlers of the async views, condition() only
+    decorates sync views in Django 4.2. The validators run in a thread.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await handler(self, request, *args, **kwargs)
+
+            etag, last_modified = await sync_to_async(validators)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await handler(self, request, *args, **kwargs)
+
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+@_validators(cache.feed_cache_key)
+def blog_list_validators(request, *args, **kwargs):
+    queryset = Blog.objects.all()
+    category = request.query_params.get('category')
+    username = request.query_params.get('username')
+    if category:
+        queryset = queryset.filter(category__name=category)
+    if username:
+        queryset = queryset.filter(author__username=username)
+
+    # the counts catch deletions, the version sum catches likes/comments and
+    # author/category renames, the counter sums catch recounts
+    stats = queryset.aggregate(
+        count=Count('id'), max_id=Max('id'), versions=Sum('version'), likes=Sum('like_count'),
+        comments=Sum('comment_count'), last_modified=Max('modified_at'))
+    return _etag('blogs', *stats.values()), stats['last_modified']
+
+
+@_validators(cache.detail_cache_key)
+def blog_detail_validators(request, slug, *args, **kwargs):
+    blog = Blog.objects.filter(slug=slug).values_list('id', 'version', 'modified_at').first()
+    if blog is None:
+        return None, None
+    return _etag('blog', *blog), blog[2]
+
+
+@_validators()
+def category_list_validators(request, *args, **kwargs):
+    stats = Category.objects.aggregate(count=Count('id'), max_id=Max('id'), last_modified=Max('modified_at'))
+    return _etag('categories', *stats.values()), stats['last_modified']
+
+
+@_validators()
+def category_detail_validators(request, pk, *args, **kwargs):
+    category = Category.objects.filter(pk=pk).values_list('id', 'modified_at').first()
+    if category is None:
+        return None, None
+    return _etag('category', *category), category[1]
+
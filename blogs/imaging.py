@@ -0,0 +1,74 @@
+"""
+Decoding and encoding of the uploaded images with bounded memory.
+
+Image.thumbnail() asks the JPEG decoder for a reduced scale (draft mode)
+and reduces other formats by an integer factor before resampling, so
+the full resolution bitmap of a large photo is never held in memory.
+Kept free of Django so the benchmark can run it in fresh processes.
+"""
+
+from PIL import Image as PILImage, ImageOps
+
+LANCZOS = getattr(PILImage, 'Resampling', PILImage).LANCZOS
+ORIENTATION = 0x0112
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def _check_pixels(img, max_pixels):
+    # the size is read from the header, nothing is decoded yet
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge('{}x{} image exceeds {} pixels'.format(img.width, img.height, max_pixels))
+
+
+def check_pixels(fp, max_pixels):
+    """
+    Raise ImageTooLarge if the image in ``fp`` has more than ``max_pixels``,
+    reading its header only. Unreadable files are left to decode_image().
+    """
+    position = fp.tell()
+    try:
+        img = PILImage.open(fp)
+    except PILImage.DecompressionBombError as error:
+        raise ImageTooLarge(str(error))
+    except (OSError, SyntaxError):
+        return
+    finally:
+        fp.seek(position)
+    _check_pixels(img, max_pixels)
+
+
+def decode_image(path, max_dimension, max_pixels):
+    """
+    Open the image at ``path`` downscaled to fit in ``max_dimension``.
+
+    Returns the decoded image, without metadata and upright, and its format.
+    """
+    img = PILImage.open(path)
+    _check_pixels(img, max_pixels)
+
+    format = img.format
+    exif = img.getexif()
+    # a reducing gap of 1 lets the decoder go down to the target size,
+    # LANCZOS then only resamples by less than 2x
+    img.thumbnail((max_dimension, max_dimension), LANCZOS, reducing_gap=1.0)
+    # thumbnail() leaves images that already fit undecoded
+    img.load()
+
+    # applying the EXIF orientation before it is stripped with the rest
+    if exif.get(ORIENTATION, 1) != 1:
+        img = ImageOps.exif_transpose(img)
+
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        has_alpha = 'A' in img.mode or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    img.info = {}
+    return img, format
+
+
+def encode_image(img, fp, format, quality=85):
+    if format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(fp, format, quality=quality, optimize=format in ('JPEG', 'PNG'))
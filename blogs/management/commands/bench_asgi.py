@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.models import Account
+from blogs.models import Blog, Category
+
+PREFIX = 'bench-asgi'
+
+# handler and ASYNC_BLOG_VIEWS of each run
+MODES = {
+    'wsgi': ('wsgi', 'false'),
+    'asgi+drf': ('asgi', 'false'),
+    'asgi+async': ('asgi', 'true'),
+}
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Load the blog list and detail endpoints through the WSGI and ASGI handlers in process, '
+            'with the DRF views and the async views')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--blogs', type=int, default=200)
+        parser.add_argument('--cache', action='store_true', help='keep the response cache, disabled by default')
+        # the urls pick the views once, so every mode runs in its own process
+        parser.add_argument('--child', choices=MODES, help='run a single mode, used by the parent process')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.run_child(options)
+
+        self.create_blogs(options['blogs'])
+        try:
+            self.stdout.write('{:>12} {:>10} {:>10} {:>10}'.format('mode', 'req/s', 'p50 (ms)', 'p99 (ms)'))
+            for mode, (_, async_views) in MODES.items():
+                command = [
+                    sys.executable, sys.argv[0], 'bench_asgi', '--child', mode,
+                    '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+                ] + (['--cache'] if options['cache'] else [])
+                output = subprocess.run(
+                    command, env={**os.environ, 'ASYNC_BLOG_VIEWS': async_views},
+                    capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.splitlines()[-1])
+                self.stdout.write('{:>12} {:>10.0f} {:>10.2f} {:>10.2f}'.format(
+                    mode, result['throughput'], result['p50'], result['p99']))
+        finally:
+            Blog.objects.filter(title__startswith=PREFIX).delete()
+            Account.objects.filter(username=PREFIX).delete()
+
+    def create_blogs(self, count):
+        author, _ = Account.objects.get_or_create(email='{}@example.com'.format(PREFIX), username=PREFIX)
+        category, _ = Category.objects.get_or_create(name=PREFIX)
+        for i in range(count):
+            Blog.objects.create(
+                author=author, category=category, title='{} {}'.format(PREFIX, i), body='<p>{}</p>'.format('body ' * 200))
+
+    def paths(self, count):
+        slugs = list(Blog.objects.filter(title__startswith=PREFIX).values_list('slug', flat=True))
+        # half feed pages, half detail pages
+        return [
+            ('/blogs/', 'limit=20&offset={}'.format(i % 100)) if i % 2 else ('/blogs/b/{}/'.format(slugs[i % len(slugs)]), '')
+            for i in range(count)
+        ]
+
+    def run_child(self, options):
+        # measuring the handlers, not the debug query log
+        settings.DEBUG = False
+        settings.ALLOWED_HOSTS = ['*']
+        if not options['cache']:
+            settings.CACHES['bench'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            settings.BLOG_CACHE_ALIAS = 'bench'
+
+        handler = MODES[options['child']][0]
+        paths = self.paths(options['requests'])
+        start = time.perf_counter()
+        if handler == 'wsgi':
+            timings = self.load_wsgi(paths, options['concurrency'])
+        else:
+            timings = asyncio.run(self.load_asgi(paths, options['concurrency']))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(json.dumps({
+            'throughput': len(timings) / elapsed,
+            'p50': percentile(timings, 0.5) * 1000,
+            'p99': percentile(timings, 0.99) * 1000,
+        }))
+
+    def load_wsgi(self, paths, concurrency):
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.test import RequestFactory
+
+        application = WSGIHandler()
+        factory = RequestFactory()
+
+        def call(path):
+            environ = factory._base_environ(PATH_INFO=path[0], QUERY_STRING=path[1], REQUEST_METHOD='GET')
+            start = time.perf_counter()
+            response = application(environ, lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+
+        # a threaded server, like gunicorn --threads
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(call, paths))
+
+    async def load_asgi(self, paths, concurrency):
+        from django.core.handlers.asgi import ASGIHandler
+
+        application = ASGIHandler()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(path):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path[0], 'query_string': path[1].encode(), 'headers': [],
+                'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                elapsed = time.perf_counter() - start
+            assert messages[0]['status'] == 200, messages[0]['status']
+            return elapsed
+
+        return await asyncio.gather(*[call(path) for path in paths])
@@ -0,0 +1,58 @@
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image as PILImage
+
+from blogs.imaging import LANCZOS, decode_image
+
+
+def _generate(path, megapixels):
+    width = int(math.sqrt(megapixels * 1_000_000 * 4 / 3))
+    height = width * 3 // 4
+    PILImage.effect_noise((width, height), 48).convert('RGB').save(path, 'JPEG', quality=90)
+
+
+def _measure(path, mode, max_dimension):
+    # run in a fresh process, ru_maxrss is the peak of the whole process
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == 'full':
+        # what Image.save() used to do, decode everything then resample
+        img = PILImage.open(path)
+        img.load()
+        img.resize((img.width // 2, img.height // 2), LANCZOS)
+    else:
+        decode_image(path, max_dimension, sys.maxsize)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, (peak - baseline) / 1024
+
+
+class Command(BaseCommand):
+    help = 'Measure the peak memory and time of decoding uploads of growing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', default='1,4,12,24,40', help='comma separated image sizes')
+        parser.add_argument('--max-dimension', type=int, default=2048)
+
+    def handle(self, *args, **options):
+        sizes = [float(size) for size in options['megapixels'].split(',')]
+        context = multiprocessing.get_context('spawn')
+
+        self.stdout.write('{:>6} {:>10} {:>12} {:>10} {:>12}'.format(
+            'MP', 'full (s)', 'full (MiB)', 'draft (s)', 'draft (MiB)'))
+        with tempfile.TemporaryDirectory() as directory:
+            for megapixels in sizes:
+                path = os.path.join(directory, '{}.jpg'.format(megapixels))
+                results = []
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    pool.apply(_generate, (path, megapixels))
+                    for mode in ('full', 'draft'):
+                        results += pool.apply(_measure, (path, mode, options['max_dimension']))
+                self.stdout.write('{:>6g} {:>10.3f} {:>12.1f} {:>10.3f} {:>12.1f}'.format(megapixels, *results))
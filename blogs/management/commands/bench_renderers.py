@@ -0,0 +1,57 @@
+import time
+
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Account
+from blogs.models import Blog, Category, Image
+from blogs.serializers import BlogListSerializer
+from config.renderers import FastJSONRenderer
+from core.bench import BenchCommand
+
+PARAGRAPH = ('Kathmandu durbar square was rebuilt after the earthquake, brick by brick, '
+             'with the carvings of the old temples put back where they stood. ') * 8
+
+
+class Command(BenchCommand):
+    help = 'Compare the JSON renderers on BlogListSerializer pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='20,100,500', help='comma separated page sizes')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--paragraphs', type=int, default=6, help='paragraphs in the body of each blog')
+
+    def bench(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        request = RequestFactory().get('/blogs/', HTTP_HOST='localhost')
+        renderers = (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer()))
+
+        self.create_blogs(max(sizes), '\n\n'.join([PARAGRAPH] * options['paragraphs']))
+        self.stdout.write('{:>6} {:>18} {:>10} {:>10}'.format('items', 'renderer', 'ms', 'bytes'))
+        for size in sizes:
+            blogs = Blog.objects.for_list().filter(title__startswith='bench-renderers')[:size]
+            data = BlogListSerializer(blogs, many=True, context={'request': request}).data
+            for name, renderer in renderers:
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    content = renderer.render(data)
+                elapsed = (time.perf_counter() - start) * 1000 / options['repeat']
+                self.stdout.write('{:>6} {:>18} {:>10.3f} {:>10}'.format(size, name, elapsed, len(content)))
+
+    def create_blogs(self, count, body):
+        author = Account.objects.create_user(email='bench-renderers@example.com', username='bench-renderers')
+        category, _ = Category.objects.get_or_create(name='bench-renderers')
+        blogs = [
+            Blog.objects.create(author=author, category=category, title='bench-renderers {}'.format(i), body=body)
+            for i in range(count)
+        ]
+        # saved without processing, as if already processed
+        variants = {
+            name: {'width': size, 'height': size * 3 // 4, 'webp': 'images/variants/x-{}.webp'.format(name),
+                   'jpeg': 'images/variants/x-{}.jpeg'.format(name)}
+            for name, size in Image.VARIANT_SIZES
+        }
+        Image.objects.bulk_create([
+            Image(blog=blog, image='images/x.jpeg', status=Image.READY, variants=variants)
+            for blog in blogs for _ in range(2)
+        ])
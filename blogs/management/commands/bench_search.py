@@ -0,0 +1,74 @@
+import itertools
+import random
+import time
+
+from accounts.models import Account
+from blogs.models import Blog, Category
+from blogs.search import ScanSearchBackend, SearchResults, get_backend
+from core.bench import BenchCommand
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnoprstuvy'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+class Command(BenchCommand):
+    help = 'Measure search on a synthetic corpus against a LIKE scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--words', type=int, default=150, help='words in the body of each post')
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def bench(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = make_vocabulary(options['vocabulary'], rng)
+        # word frequencies follow Zipf's law, like natural text
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        start = time.perf_counter()
+        self.create_posts(options['posts'], options['words'], vocabulary, weights, rng)
+        self.stdout.write('created {} posts in {:.1f}s'.format(options['posts'], time.perf_counter() - start))
+
+        backend = get_backend()
+        start = time.perf_counter()
+        backend.rebuild()
+        self.stdout.write('built the {} index in {:.1f}s'.format(type(backend).__name__, time.perf_counter() - start))
+
+        queries = {
+            'frequent word': vocabulary[2],
+            'rare word': vocabulary[5000],
+            'two words': '{} {}'.format(vocabulary[10], vocabulary[200]),
+            'prefix': vocabulary[50][:3],
+        }
+        self.stdout.write('{:>14} {:>8} {:>12} {:>12}'.format('query', 'hits', 'index (ms)', 'scan (ms)'))
+        for name, query in queries.items():
+            timings = [self.measure(query, search_backend, options['repeat'])
+                       for search_backend in (backend, ScanSearchBackend())]
+            self.stdout.write('{:>14} {:>8} {:>12.2f} {:>12.2f}'.format(
+                name, timings[0][0], timings[0][1], timings[1][1]))
+
+    def create_posts(self, count, words, vocabulary, weights, rng):
+        author = Account.objects.create_user(email='bench-search@example.com', username='bench-search')
+        category, _ = Category.objects.get_or_create(name='bench-search')
+        for first in range(0, count, 5000):
+            # created without the signals, the index is rebuilt afterwards
+            Blog.objects.bulk_create([
+                Blog(
+                    author=author, category=category, slug='bench-search-{}'.format(i),
+                    title=' '.join(rng.choices(vocabulary, cum_weights=weights, k=6)).capitalize(),
+                    body=' '.join(rng.choices(vocabulary, cum_weights=weights, k=words)),
+                )
+                for i in range(first, min(first + 5000, count))
+            ])
+
+    def measure(self, query, backend, repeat):
+        # counting the hits and fetching the first page, like the endpoint
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = SearchResults(query, backend)
+            hits = results.count()
+            results[0:20]
+        return hits, (time.perf_counter() - start) * 1000 / repeat
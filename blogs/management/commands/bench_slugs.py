@@ -0,0 +1,57 @@
+import time
+
+from django.db import connection
+from django.utils.text import slugify
+
+from accounts.models import Account
+from blogs.models import Blog, Category
+from blogs.utils import unique_slug_generator
+from core.bench import BenchCommand, QueryCounter
+
+
+def _recursive_slug(instance, new_slug=None, suffix=1):
+    # the previous allocator, one existence query per taken suffix
+    slug = new_slug or slugify(instance.title)
+    if Blog.objects.filter(slug=slug).exists():
+        suffix += 1
+        return _recursive_slug(instance, '{}-{}'.format(slugify(instance.title), suffix), suffix)
+    return slug
+
+
+class Command(BenchCommand):
+    help = 'Measure the slug allocation of many blogs sharing a title'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000)
+        parser.add_argument('--title', default='Hello world')
+
+    def bench(self, *args, **options):
+        count = options['count']
+        author = Account.objects.create(
+            name='bench', username='bench-slugs', email='bench-slugs@example.com')
+        category, _ = Category.objects.get_or_create(name='bench-slugs')
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for _ in range(count):
+                Blog.objects.create(author=author, category=category, title=options['title'], body='')
+        elapsed = time.perf_counter() - start
+        self.stdout.write('created {} blogs in {:.2f}s, {:.2f} ms and {:.1f} queries per blog'.format(
+            count, elapsed, elapsed * 1000 / count, counter.count / count))
+
+        # the cost of one more post with the same title, both allocators
+        blog = Blog(author=author, category=category, title=options['title'])
+        for name, allocate in (('recursive', _recursive_slug), ('prefix query', unique_slug_generator)):
+            counter = QueryCounter()
+            start = time.perf_counter()
+            try:
+                with connection.execute_wrapper(counter):
+                    allocate(blog)
+            except RecursionError:
+                # one stack frame per taken suffix
+                self.stdout.write('{:>12}: recursion limit hit after {} queries'.format(name, counter.count))
+                continue
+            elapsed = time.perf_counter() - start
+            self.stdout.write('{:>12}: {:>8.2f} ms {:>6} queries'.format(name, elapsed * 1000, counter.count))
+
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from blogs.models import Blog, Image, invalidate_blog_cache
+from blogs.tasks import process_image
+
+
+class Command(BaseCommand):
+    help = 'Process the uploaded images left pending, e.g. by a restart during processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='also retry the images that failed')
+        parser.add_argument(
+            '--missing-variants', action='store_true',
+            help='generate the variants of processed images uploaded before variants existed')
+
+    def handle(self, *args, **options):
+        statuses = [Image.PENDING, Image.PROCESSING]
+        if options['retry_failed']:
+            statuses.append(Image.FAILED)
+
+        # the command is run while no worker is processing these images
+        image_ids = list(Image.objects.filter(status__in=statuses).values_list('pk', flat=True))
+        Image.objects.filter(pk__in=image_ids).update(status=Image.PENDING)
+        for image_id in image_ids:
+            process_image(image_id)
+
+        self.stdout.write(self.style.SUCCESS('Processed {} image(s)'.format(len(image_ids))))
+
+        if options['missing_variants']:
+            images = Image.objects.filter(status=Image.READY, variants={})
+            for image in images:
+                Image.objects.filter(pk=image.pk).update(variants=image.generate_variants())
+                # like blogs.tasks.process_image, the srcset changed without a save()
+                Blog.objects.filter(pk=image.blog_id).touch()
+                invalidate_blog_cache(image.blog_id)
+            self.stdout.write(self.style.SUCCESS('Generated the variants of {} image(s)'.format(len(images))))
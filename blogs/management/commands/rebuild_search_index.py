@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blogs.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the blogs, e.g. after blogs were written without signals'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the {} search index'.format(type(backend).__name__)))
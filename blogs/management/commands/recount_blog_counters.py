@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blogs.models import Blog
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like/comment counters of the blogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='only repair the blogs with these slugs')
+
+    def handle(self, *args, **options):
+        queryset = Blog.objects.all()
+        if options['slugs']:
+            queryset = queryset.filter(slug__in=options['slugs'])
+
+        repaired = queryset.recount()
+        self.stdout.write(self.style.SUCCESS('Repaired the counters of {} blog(s)'.format(repaired)))
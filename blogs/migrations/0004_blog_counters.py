@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_per_blog(model):
+    counts = (
+        model.objects.filter(blog=OuterRef('pk'))
+        .order_by()
+        .values('blog')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def populate_counters(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Blog.objects.update(
+        like_count=count_per_blog(apps.get_model('blogs', 'Like')),
+        comment_count=count_per_blog(apps.get_model('blogs', 'Comment')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0003_alter_category_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0004_blog_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['-pub_date', '-id'], name='blog_pub_date_id_idx'),
+        ),
+    ]
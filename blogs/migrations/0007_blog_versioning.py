@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 19:39
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_modified_at(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Blog.objects.update(modified_at=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0006_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_modified_at, migrations.RunPython.noop),
+    ]
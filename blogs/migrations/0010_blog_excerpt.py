@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 20:06
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+
+def make_excerpt(body, length=300):
+    text = ' '.join(strip_tags(body).split())
+    if len(text) <= length:
+        return text
+    text = text[:length + 1]
+    if ' ' in text:
+        text = text.rsplit(' ', 1)[0]
+    return text[:length - 1].rstrip(' .,;:') + '…'
+
+
+def populate_excerpts(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    batch = []
+    for blog in Blog.objects.only('pk', 'body').iterator(chunk_size=500):
+        blog.excerpt = make_excerpt(blog.body)
+        batch.append(blog)
+        if len(batch) == 500:
+            Blog.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    Blog.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0009_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.RunPython(populate_excerpts, migrations.RunPython.noop),
+    ]
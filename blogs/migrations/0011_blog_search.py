@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 20:20
+
+from django.db import migrations
+
+from blogs.search import get_backend
+
+
+# the index is created by the search backend of the database, see blogs/search.py
+def create_search_index(apps, schema_editor):
+    get_backend(schema_editor.connection.vendor).install(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    get_backend(schema_editor.connection.vendor).uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0010_blog_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
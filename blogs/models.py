@@ -1,12 +1,20 @@
-from django.db import models
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
 from django.utils.text import slugify
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.utils import timezone
 
-from PIL import Image as PILImage
-
-from .utils import unique_slug_generator
+from .imaging import LANCZOS, ImageTooLarge, check_pixels, decode_image, encode_image
+from .utils import EXCERPT_LENGTH, make_excerpt, unique_slug_generator
+from . import cache
 from accounts.models import Account
 
 
@@ -20,6 +28,7 @@ class Category(models.Model):
     # customize save method to automatically create slug
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
+        self.modified_at = timezone.now()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -32,42 +41,231 @@ class Category(models.Model):
 
 
 
+class BlogQuerySet(models.QuerySet):
+    # queryset used to render blogs through the list/detail serializers,
+    # loads everything the serializers touch in a fixed number of queries
+    def for_list(self):
+        return self.select_related('author', 'category').prefetch_related('images')
+
+    # filters of the blog feed, the category name and username are resolved
+    # to ids up front so the feed is a range scan of the (fk, pub_date) indexes
+    def for_feed(self, category=None, username=None):
+        filters = {}
+        if category:
+            filters['category_id'] = _lookup_id(Category.objects.filter(name=category))
+        if username:
+            filters['author_id'] = _lookup_id(Account.objects.filter(username=username))
+        return self._feed(filters)
+
+    # for_feed() of the async views, the ids are looked up with the async ORM
+    async def afor_feed(self, category=None, username=None):
+        filters = {}
+        if category:
+            filters['category_id'] = await Category.objects.filter(name=category).values_list('id', flat=True).afirst()
+        if username:
+            filters['author_id'] = await Account.objects.filter(username=username).values_list('id', flat=True).afirst()
+        return self._feed(filters)
+
+    def _feed(self, filters):
+        if None in filters.values():
+            return self.none()
+        return self.filter(**filters)
+
+    # mark the blogs as changed without saving them, their version and
+    # modified_at feed the ETag/Last-Modified validators
+    def touch(self, **changes):
+        return self.update(version=F('version') + 1, modified_at=Now(), **changes)
+
+    # recompute the denormalized counters from the Like/Comment tables,
+    # returns the number of blogs whose counters had drifted
+    def recount(self):
+        actual_likes = count_per_blog(Like)
+        actual_comments = count_per_blog(Comment)
+        drifted = self.annotate(
+            actual_likes=actual_likes,
+            actual_comments=actual_comments,
+        ).exclude(
+            like_count=F('actual_likes'),
+            comment_count=F('actual_comments'),
+        ).values_list('pk', flat=True)
+        drifted = self.model.objects.filter(pk__in=list(drifted))
+        updated = drifted.update(
+            like_count=actual_likes,
+            comment_count=actual_comments,
+        )
+        # update() sends no signals, evicting the cached responses here
+        scopes = set()
+        for blog in drifted.values_list('slug', 'category__name', 'author__username'):
+            scopes.update(cache.blog_scopes(*blog))
+        if scopes:
+            cache.invalidate(*scopes)
+        return updated
+
+
+def _lookup_id(queryset):
+    ids = list(queryset.values_list('id', flat=True)[:1])
+    return ids[0] if ids else None
+
+
+def count_per_blog(model):
+    # correlated COUNT(*) subquery, avoids grouping the joined blog rows
+    counts = (
+        model.objects.filter(blog=OuterRef('pk'))
+        .order_by()
+        .values('blog')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+# inserts tried before giving up on a slug conflicting with concurrent posts
+SLUG_ATTEMPTS = 3
+
+
 class Blog(models.Model):
     title = models.CharField(max_length=100)
     slug = models.SlugField(max_length=100, unique=True, null=True, blank=True)
     author = models.ForeignKey(Account, on_delete=models.CASCADE)
     pub_date = models.DateTimeField('date published', auto_now_add=True)
     body = models.TextField()
+    # plain text teaser of the body, lets the feed leave the body unloaded
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
+    # denormalized counters, kept in sync by the Like/Comment signals below
+    # and repaired in bulk by the recount_blog_counters command
+    comment_count = models.PositiveIntegerField(default=0)
+    like_count = models.PositiveIntegerField(default=0)
+
+    # bumped whenever the blog or its likes, comments and images change
+    modified_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)
+
+    objects = BlogQuerySet.as_manager()
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # matches the ordering of BlogCursorPagination
+            models.Index(fields=['-pub_date', '-id'], name='blog_pub_date_id_idx'),
+            # feed filtered by category and/or author, ordered by pub_date
+            models.Index(fields=['category', '-pub_date'], name='blog_category_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'], name='blog_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    # generate the slug before the insert, saving the blog only once
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.body)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'body' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt'}
+
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        # a concurrent insert may take the slug between the lookup and the
+        # insert, the unique index rejects ours and a new slug is allocated
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = unique_slug_generator(self)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == SLUG_ATTEMPTS - 1:
+                    raise
+
 @receiver(post_save, sender=Blog)
 def add_modified_date_to_category(sender, instance, **kwargs):
-    instance.category.modified_at = timezone.now()
-    instance.category.save()
+    # single UPDATE of the column, without loading or saving the category
+    Category.objects.filter(pk=instance.category_id).update(modified_at=timezone.now())
+
+def validate_image_pixels(file):
+    # the uploads above IMAGE_MAX_PIXELS are rejected before being stored
+    try:
+        check_pixels(file, getattr(settings, 'IMAGE_MAX_PIXELS', 50_000_000))
+    except ImageTooLarge as error:
+        raise ValidationError(str(error), code='image_too_large')
+
 
 class Image(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
+    # variants generated for every image, name and longest side in pixels
+    VARIANT_SIZES = (
+        ('thumbnail', 320),
+        ('medium', 768),
+        ('large', 1600),
+    )
+
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='images/', null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # {'thumbnail': {'width': 320, 'height': 240, 'webp': <name>, 'jpeg': <name>}, ...}
+    variants = models.JSONField(default=dict, blank=True)
     
     def __str__(self):
         return self.image.__str__()
 
-    # compress image when saving
+    # the upload is stored as is, compressing it is left to the
+    # background workers of blogs.tasks once the request commits
     def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            validate_image_pixels(self.image.file)
         super(Image, self).save(*args, **kwargs)
 
-        img = PILImage.open(self.image.path)
-        height, width = img.size
+        if self.status == self.PENDING and self.image:
+            from .tasks import enqueue_image_processing
+            enqueue_image_processing(self.pk)
+
+    # downscale the stored upload in place and generate its variants,
+    # run by the image processing workers, returns the new variants
+    def process(self):
+        img, format = self._decode(getattr(settings, 'IMAGE_MAX_DIMENSION', 2048))
+        with self.image.storage.open(self.image.name, 'wb') as fp:
+            encode_image(img, fp, format)
+        return self.generate_variants(img, format)
 
-        img = img.resize((width//2, height//2), PILImage.ANTIALIAS)
-        img.save(self.image.path, optimize=True, quality=95)
-        print(img.size)
+    # store the resized copies of the image in WebP and in its own format
+    def generate_variants(self, img=None, format=None):
+        if img is None:
+            img, format = self._decode(max(size for name, size in self.VARIANT_SIZES))
+        formats = ['WEBP', format or 'JPEG']
+        stem = os.path.splitext(os.path.basename(self.image.name))[0]
+
+        variants = {}
+        for name, size in self.VARIANT_SIZES:
+            variant = img.copy()
+            variant.thumbnail((size, size), LANCZOS)
+            files = {'width': variant.width, 'height': variant.height}
+            for variant_format in formats:
+                files[variant_format.lower()] = self._save_variant(
+                    variant, variant_format, '{}-{}'.format(stem, name))
+            variants[name] = files
+        return variants
+
+    def _decode(self, max_dimension):
+        return decode_image(
+            self.image.path, max_dimension, getattr(settings, 'IMAGE_MAX_PIXELS', 50_000_000))
+
+    def _save_variant(self, img, format, name):
+        buffer = BytesIO()
+        encode_image(img, buffer, format, quality=80)
+        extension = 'jpg' if format == 'JPEG' else format.lower()
+        path = 'images/variants/{}.{}'.format(name, extension)
+        return self.image.storage.save(path, ContentFile(buffer.getvalue()))
 
 
 
@@ -81,17 +279,48 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['commented_at']
+        indexes = [
+            models.Index(fields=['blog', 'commented_at'], name='comment_blog_commented_at_idx'),
+        ]
 
     def __str__(self):
         return self.comment
 
 
+class LikeQuerySet(models.QuerySet):
+    # idempotent like, returns whether the like was added; a concurrent
+    # request adding the same like is caught by the unique constraint
+    def add(self, blog_id, account):
+        try:
+            with transaction.atomic():
+                self.create(blog_id=blog_id, account=account)
+        except IntegrityError:
+            return False
+        return True
+
+    # idempotent unlike, a single conditional delete of the pair,
+    # returns whether there was a like to remove
+    def remove(self, blog_id, account):
+        deleted, _ = self.filter(blog_id=blog_id, account=account).delete()
+        return deleted > 0
+
+    # returns whether the blog is liked afterwards, a double tap racing
+    # this one may have added the like already, it stays liked then
+    def toggle(self, blog_id, account):
+        if self.remove(blog_id, account):
+            return False
+        self.add(blog_id, account)
+        return True
+
+
 # Model for the post likes
 class Like(models.Model):
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='likes')
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     liked_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LikeQuerySet.as_manager()
+
     # a user can only like a post once
     class Meta:
         unique_together = ('blog', 'account')
@@ -101,9 +330,134 @@ class Like(models.Model):
         return self.account.username
 
 
-# signal to create slug after saving the blog
+def adjust_blog_counter(blog_id, field, delta):
+    # single UPDATE with an F() expression so concurrent likes/comments
+    # never overwrite each other's increments
+    Blog.objects.filter(pk=blog_id).touch(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def origin_model(origin):
+    # model of the instance or queryset a cascading delete started from
+    return origin.model if isinstance(origin, models.QuerySet) else type(origin)
+
+
+def deleted_with_blog(origin):
+    # the counters of a blog that is being deleted don't need updating
+    return origin_model(origin) is Blog
+
+
+# signals to keep the like/comment counters of the blog up to date
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def increment_blog_counter(sender, instance, created, **kwargs):
+    if created:
+        field = 'like_count' if sender is Like else 'comment_count'
+        adjust_blog_counter(instance.blog_id, field, 1)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def decrement_blog_counter(sender, instance, origin=None, **kwargs):
+    if not deleted_with_blog(origin):
+        field = 'like_count' if sender is Like else 'comment_count'
+        adjust_blog_counter(instance.blog_id, field, -1)
+
+
+# signal to mark the blog as changed when its images or comments are edited
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def touch_blog(sender, instance, created=False, origin=None, **kwargs):
+    # new comments are already counted by increment_blog_counter
+    if sender is Comment and created:
+        return
+    if not deleted_with_blog(origin):
+        Blog.objects.filter(pk=instance.blog_id).touch()
+
+
+def deleted_with_owner(origin):
+    # deleting a blog, author or category invalidates the cache by itself
+    return origin_model(origin) in (Blog, Account, Category)
+
+
+def invalidate_blog_cache(blog_id):
+    blog = Blog.objects.filter(pk=blog_id).values_list('slug', 'category__name', 'author__username').first()
+    if blog is not None:
+        cache.invalidate(*cache.blog_scopes(*blog))
+
+
+# signals to evict the cached responses a change shows up in
+@receiver(pre_save, sender=Blog)
+def remember_blog_category(sender, instance, **kwargs):
+    # an updated blog may be leaving a category whose feed is cached
+    if not instance._state.adding:
+        instance._previous_category = (
+            Category.objects.filter(blog=instance.pk).values_list('name', flat=True).first())
+
+
 @receiver(post_save, sender=Blog)
-def create_slug(sender, instance, *args, **kwargs):
-    if not instance.slug:
-        instance.slug = unique_slug_generator(instance)
-        instance.save()
+@receiver(post_delete, sender=Blog)
+def invalidate_blog_responses(sender, instance, origin=None, **kwargs):
+    if origin_model(origin) in (Account, Category):
+        return
+    scopes = cache.blog_scopes(instance.slug, instance.category.name, instance.author.username)
+    previous_category = getattr(instance, '_previous_category', None)
+    if previous_category is not None:
+        scopes.append('category:{}'.format(previous_category))
+    cache.invalidate(*scopes)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Image)
+def invalidate_blog_responses_on_save(sender, instance, **kwargs):
+    invalidate_blog_cache(instance.blog_id)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Image)
+def invalidate_blog_responses_on_delete(sender, instance, origin=None, **kwargs):
+    if not deleted_with_owner(origin):
+        invalidate_blog_cache(instance.blog_id)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_responses(sender, instance, created, update_fields=None, **kwargs):
+    # bumping modified_at doesn't change any response
+    if created or (update_fields is not None and set(update_fields) == {'modified_at'}):
+        return
+    # the blogs' validators are derived from their rows
+    Blog.objects.filter(category=instance).touch()
+    cache.invalidate_all()
+
+
+@receiver(post_save, sender=Account)
+def invalidate_author_responses(sender, instance, created, update_fields=None, **kwargs):
+    # the author name and username are rendered in every response
+    if created or (update_fields is not None and not {'name', 'username'} & set(update_fields)):
+        return
+    Blog.objects.filter(author=instance).touch()
+    cache.invalidate_all()
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Account)
+def invalidate_owner_responses(sender, instance, **kwargs):
+    cache.invalidate_all()
+
+
+
+# the search index is updated in the transaction saving the blog
+@receiver(post_save, sender=Blog)
+def index_blog(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'title', 'body'} & set(update_fields):
+        return
+    from .search import get_backend
+    get_backend().index(instance, created)
+
+
+@receiver(post_delete, sender=Blog)
+def unindex_blog(sender, instance, **kwargs):
+    from .search import get_backend
+    get_backend().remove(instance.pk)
@@ -1,5 +1,51 @@
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
 
 
 class CustomLimitOffsetPagination(LimitOffsetPagination):
-    default_limit = 20
\ No newline at end of file
+    default_limit = 20
+
+    # paginate_queryset() for the async views, counts and fetches the page
+    # with the async ORM
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in queryset[self.offset:self.offset + self.limit]]
+
+
+# keyset pagination for the blog feed, opted into with ?pagination=cursor,
+# pages are fetched with an index range scan and no COUNT(*) of the table
+class BlogCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+
+    @classmethod
+    def is_requested(cls, request):
+        return request.query_params.get('pagination') == 'cursor' or cls.cursor_query_param in request.query_params
+
+
+# comments of a blog, oldest first
+class CommentCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('commented_at', 'id')
+
+    # first page embedded in another response, its links point at ``url``.
+    # Always the default page size from the start, the query parameters of
+    # the embedding request don't apply (the blog detail is cached by slug)
+    def paginate_embedded(self, queryset, url):
+        self.base_url = url
+        results = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.cursor = None
+        self.has_previous = False
+        self.has_next = len(results) > self.page_size
+        if self.has_next:
+            self.next_position = self._get_position_from_instance(results[-1], self.ordering)
+        return self.page
@@ -0,0 +1,226 @@
+"""
+Full-text search over the titles and bodies of the blogs.
+
+Each database vendor has its backend:
+
+    sqlite   an FTS5 table (blogs_blog_fts) holding the plain text of the
+             blogs, kept up to date by the Blog signals, ranked with bm25
+    mysql    a FULLTEXT index on blogs_blog, maintained by MySQL itself
+
+Other databases fall back to a LIKE scan. Queries match every word, the
+last one as a prefix, and the highlights are HTML escaped with the
+matches wrapped in <mark>.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.utils.html import escape, strip_tags
+
+from .models import Blog
+
+# matches are delimited with control characters, then escaped and marked
+START, END = '\x02', '\x03'
+
+Hit = namedtuple('Hit', ('blog_id', 'rank', 'title', 'snippet'))
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def plain_text(body):
+    return ' '.join(strip_tags(body).split())
+
+
+def mark(text):
+    return escape(text).replace(START, '<mark>').replace(END, '</mark>')
+
+
+class SearchBackend:
+    # called by migration 0011, schema_editor may be on any database
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def index(self, blog, created=False):
+        pass
+
+    def remove(self, blog_id):
+        pass
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        pass
+
+    def count(self, terms):
+        raise NotImplementedError
+
+    def search(self, terms, limit, offset):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    table = 'blogs_blog_fts'
+    # the title weighs more than the body in the bm25 rank
+    weights = (10.0, 1.0)
+    snippet_tokens = 24
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE {} USING fts5(title, body, tokenize='porter unicode61')".format(self.table))
+        # indexing the blogs already there
+        self.rebuild(schema_editor.connection.alias)
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute('DROP TABLE IF EXISTS {}'.format(self.table))
+
+    def index(self, blog, created=False):
+        with connection.cursor() as cursor:
+            # a new blog has no row to replace
+            if not created:
+                cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(self.table), [blog.pk])
+            cursor.execute(
+                'INSERT INTO {} (rowid, title, body) VALUES (%s, %s, %s)'.format(self.table),
+                [blog.pk, blog.title, plain_text(blog.body)])
+
+    def remove(self, blog_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(self.table), [blog_id])
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(self.table))
+            batch = []
+            for blog in Blog.objects.using(using).order_by().only('pk', 'title', 'body').iterator(chunk_size=1000):
+                batch.append((blog.pk, blog.title, plain_text(blog.body)))
+                if len(batch) == 1000:
+                    self._insert(cursor, batch)
+                    batch = []
+            self._insert(cursor, batch)
+            cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(self.table))
+
+    def _insert(self, cursor, rows):
+        cursor.executemany('INSERT INTO {} (rowid, title, body) VALUES (%s, %s, %s)'.format(self.table), rows)
+
+    def match(self, terms):
+        # every word quoted, so the FTS5 query syntax can't be injected
+        return ' '.join('"{}"'.format(term) for term in terms) + '*'
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM {0} WHERE {0} MATCH %s'.format(self.table), [self.match(terms)])
+            return cursor.fetchone()[0]
+
+    def search(self, terms, limit, offset):
+        sql = (
+            'SELECT rowid, bm25({0}, %s, %s) AS rank, '
+            'highlight({0}, 0, %s, %s), snippet({0}, 1, %s, %s, %s, %s) '
+            'FROM {0} WHERE {0} MATCH %s ORDER BY rank LIMIT %s OFFSET %s'
+        ).format(self.table)
+        params = [*self.weights, START, END, START, END, '…', self.snippet_tokens, self.match(terms), limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25 is lower for better matches, the API ranks higher
+            return [Hit(row[0], -row[1], mark(row[2]), mark(row[3])) for row in cursor.fetchall()]
+
+
+class PythonHighlightMixin:
+    snippet_length = 160
+
+    def highlight(self, text, terms):
+        pattern = re.compile(r'\b({})\w*'.format('|'.join(re.escape(term) for term in terms)), re.IGNORECASE)
+        return pattern.sub(lambda match: START + match.group(0) + END, text)
+
+    def snippet(self, body, terms):
+        text = plain_text(body)
+        match = re.search(r'\b({})'.format('|'.join(re.escape(term) for term in terms)), text, re.IGNORECASE)
+        start = max((match.start() if match else 0) - self.snippet_length // 4, 0)
+        snippet = text[start:start + self.snippet_length]
+        return ('…' if start else '') + snippet + ('…' if start + self.snippet_length < len(text) else '')
+
+    def hits(self, rows, terms):
+        return [
+            Hit(blog_id, rank, mark(self.highlight(title, terms)), mark(self.highlight(self.snippet(body, terms), terms)))
+            for blog_id, rank, title, body in rows
+        ]
+
+
+class MySQLSearchBackend(PythonHighlightMixin, SearchBackend):
+    index_name = 'blog_search_idx'
+
+    def install(self, schema_editor):
+        schema_editor.execute('CREATE FULLTEXT INDEX {} ON blogs_blog (title, body)'.format(self.index_name))
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute('DROP INDEX {} ON blogs_blog'.format(self.index_name))
+
+    def match(self, terms):
+        # boolean mode, every word required and the last one as a prefix
+        return ' '.join('+{}'.format(term) for term in terms) + '*'
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM blogs_blog WHERE MATCH (title, body) AGAINST (%s IN BOOLEAN MODE)',
+                [self.match(terms)])
+            return cursor.fetchone()[0]
+
+    def search(self, terms, limit, offset):
+        sql = (
+            'SELECT id, MATCH (title, body) AGAINST (%s IN BOOLEAN MODE) AS score, title, body '
+            'FROM blogs_blog WHERE MATCH (title, body) AGAINST (%s IN BOOLEAN MODE) '
+            'ORDER BY score DESC, id DESC LIMIT %s OFFSET %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.match(terms), self.match(terms), limit, offset])
+            return self.hits(cursor.fetchall(), terms)
+
+
+class ScanSearchBackend(PythonHighlightMixin, SearchBackend):
+    """No index, every blog is scanned with LIKE."""
+
+    def filter(self, terms):
+        queryset = Blog.objects.order_by('-pub_date', '-id')
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(body__icontains=term))
+        return queryset
+
+    def count(self, terms):
+        return self.filter(terms).count()
+
+    def search(self, terms, limit, offset):
+        rows = self.filter(terms).values_list('id', 'title', 'body')[offset:offset + limit]
+        return self.hits([(blog_id, 0, title, body) for blog_id, title, body in rows], terms)
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'mysql': MySQLSearchBackend,
+}
+
+
+def get_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, ScanSearchBackend)()
+
+
+class SearchResults:
+    """
+    The hits of a query, counted and sliced lazily like a queryset, so the
+    paginators can run it.
+    """
+
+    def __init__(self, query, backend=None):
+        self.terms = tokenize(query)
+        self.backend = backend or get_backend()
+
+    def count(self):
+        return self.backend.count(self.terms) if self.terms else 0
+
+    def __getitem__(self, page):
+        if not self.terms:
+            return []
+        return self.backend.search(self.terms, page.stop - page.start, page.start)
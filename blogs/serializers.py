@@ -1,29 +1,59 @@
 from unicodedata import category, name
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
-from .models import Blog, Image, Category, Comment, Like
+from core.metrics import TimedSerializerMixin
+from .models import Blog, Image, Category, Comment, Like, validate_image_pixels
+from .paginations import CommentCursorPagination
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
 class ImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
+    # the generated variants referenced in the srcset map
+    variant_names = ('thumbnail', 'medium', 'large')
+
     class Meta:
         model = Image
-        fields = ('image_url',)
+        fields = ('image_url', 'status', 'srcset')
 
     def get_image_url(self, obj):
         request = self.context.get('request')
         photo_url = obj.image.url
         return request.build_absolute_uri(photo_url)
 
+    # {'thumbnail': {'width': 320, 'height': 240, 'webp': <url>, 'jpeg': <url>}, ...}
+    def get_srcset(self, obj):
+        request = self.context.get('request')
+        srcset = {}
+        for name in self.variant_names:
+            if name not in obj.variants:
+                continue
+            srcset[name] = {
+                key: value if key in ('width', 'height') else request.build_absolute_uri(obj.image.storage.url(value))
+                for key, value in obj.variants[name].items()
+            }
+        return srcset
+
+
+# the feed cards only need the small variants
+class ListImageSerializer(ImageSerializer):
+    variant_names = ('thumbnail', 'medium')
+
+
+class DetailImageSerializer(ImageSerializer):
+    variant_names = ('medium', 'large')
+
 
 """
 Serailizer for the Comment model
 """
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     commented_by = serializers.ReadOnlyField(source='account.name')
     class Meta:
         model = Comment
@@ -35,7 +65,7 @@ class CommentSerializer(serializers.ModelSerializer):
 """
 Serializer for the Likes model
 """
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='account.name')
     class Meta:
         model = Like
@@ -45,13 +75,14 @@ class LikeSerializer(serializers.ModelSerializer):
 """
 List serializer for the Blog model
 """
-class BlogListSerializer(serializers.ModelSerializer):
+class BlogListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # adding image field to the serializer
-    images = ImageSerializer(many=True, required=False)
+    images = ListImageSerializer(many=True, required=False)
     author = serializers.ReadOnlyField(source='author.name')
-    comment_count = serializers.ReadOnlyField(source='comments.count')
-    like_count = serializers.ReadOnlyField(source='likes.count')
+    comment_count = serializers.ReadOnlyField()
+    like_count = serializers.ReadOnlyField()
     category = serializers.CharField(source='category.name')
+    excerpt = serializers.ReadOnlyField()
     
     class Meta:
         model = Blog
@@ -67,19 +98,50 @@ class BlogListSerializer(serializers.ModelSerializer):
             'author',
             'comment_count',
             'like_count',
+            'excerpt',
         )
-        
+
+    # only returned when asked for with ?fields= or ?excerpt=true
+    optional_fields = ('excerpt',)
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            fields = [name for name in self.fields if name not in self.optional_fields]
+        for name in list(self.fields):
+            if name not in fields:
+                self.fields.pop(name)
+
+    @classmethod
+    def select_fields(cls, fields=None, exclude=None, excerpt=False):
+        """
+        The fields of a sparse fieldset, from the comma separated ``fields``
+        and ``exclude`` lists. The excerpt mode returns the excerpt instead
+        of the body. Raises ValueError naming the unknown fields.
+        """
+        available = dict.fromkeys(cls.Meta.fields)
+        if fields:
+            selected = [name.strip() for name in fields.split(',') if name.strip()]
+        else:
+            selected = [name for name in available if name not in cls.optional_fields]
+        excluded = [name.strip() for name in (exclude or '').split(',') if name.strip()]
+
+        unknown = [name for name in selected + excluded if name not in available]
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(unknown)))
+
+        if excerpt:
+            selected = ['excerpt' if name == 'body' else name for name in selected]
+        return [name for name in dict.fromkeys(selected) if name not in excluded]
+
 
 """
 Serializer for the detail view of the Blog model
 """
 class BlogDetailSerializer(BlogListSerializer):
-    images = ImageSerializer(many=True, required=False)
+    images = DetailImageSerializer(many=True, required=False)
     author = serializers.ReadOnlyField(source='author.name')
-    comment_count = serializers.ReadOnlyField(source='comments.count')
-    like_count = serializers.ReadOnlyField(source='likes.count')
     category = serializers.CharField(source='category.name')
-    comments = CommentSerializer(many=True, required=False)
     # likes = LikeSerializer(many=True, required=False)
 
     class Meta:
@@ -96,10 +158,29 @@ class BlogDetailSerializer(BlogListSerializer):
             'author',
             'comment_count',
             'like_count',
-            'comments',
             # 'likes',
         )
-        read_only_fields = ('id', 'pub_date','comment_count','like_count','comments')
+        read_only_fields = ('id', 'pub_date','comment_count','like_count')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+
+        # embedding the first page of comments, the next pages
+        # are fetched from the comments endpoint
+        request = self.context['request']
+        paginator = CommentCursorPagination()
+        comments = paginator.paginate_embedded(
+            instance.comments.select_related('account'),
+            reverse('blog-comments', args=[instance.slug], request=request))
+        data['comments'] = CommentSerializer(comments, many=True).data
+        data['comments_next'] = paginator.get_next_link()
+        return data
+
+    def validate(self, attrs):
+        # before the blog or any upload is stored
+        for image in self.context['request'].FILES.getlist('images'):
+            validate_image_pixels(image)
+        return attrs
 
     def validate_category(self, value):
         try:
@@ -117,8 +198,6 @@ class BlogDetailSerializer(BlogListSerializer):
 
         # creating the blog instance
         blog = Blog.objects.create(**validated_data, category=Category.objects.get(name=category))
-        # return blog
-        blog.save()
 
         # adding images to the blog
         
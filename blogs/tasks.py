@@ -0,0 +1,72 @@
+"""
+Background processing of the uploaded blog images.
+
+Uploads are stored once by the request and compressed afterwards by a
+small in-process thread pool, so multi-image posts don't block the
+worker. The status column of the image is the job state: rows left
+pending by a restart are picked up again by the process_images command.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Blog, Image, invalidate_blog_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2),
+                thread_name_prefix='image-processing',
+            )
+    return _executor
+
+
+def enqueue_image_processing(image_id):
+    if not getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+        process_image(image_id)
+        return
+    # the worker must see the committed row
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, image_id))
+
+
+def _run_in_worker(image_id):
+    try:
+        process_image(image_id)
+    except Exception:
+        logger.exception('Processing of image %s failed', image_id)
+    finally:
+        # the worker threads outlive requests, don't keep their connection open
+        connection.close()
+
+
+def process_image(image_id):
+    # claiming the job, another worker may already be processing it
+    claimed = Image.objects.filter(pk=image_id, status=Image.PENDING).update(status=Image.PROCESSING)
+    if not claimed:
+        return
+
+    image = Image.objects.get(pk=image_id)
+    try:
+        variants = image.process()
+    except Exception:
+        logger.exception('Could not process image %s', image_id)
+        status, variants = Image.FAILED, {}
+    else:
+        status = Image.READY
+
+    # updating without save() so the image isn't queued again
+    Image.objects.filter(pk=image_id).update(status=status, variants=variants)
+    Blog.objects.filter(pk=image.blog_id).touch()
+    invalidate_blog_cache(image.blog_id)
@@ -1,3 +1,1006 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import Account
+from config.renderers import FastJSONRenderer
+from .models import Blog, Category, Comment, Image, Like, LikeQuerySet
+from . import async_views, cache, search, tasks
+from .utils import taken_slugs, unique_slug_generator
+
+
+class BlogTestCase(TestCase):
+    """Helpers for creating the objects the blog endpoints render."""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def create_account(self, username='author'):
+        return Account.objects.create_user(
+            email='{}@example.com'.format(username), username=username, password='password')
+
+    def create_blogs(self, count, author=None, category=None):
+        author = author or self.author
+        category = category or self.category
+        blogs = []
+        for i in range(count):
+            blogs.append(Blog.objects.create(
+                title='Blog {}'.format(i), body='body', author=author, category=category))
+        return blogs
+
+
+class BlogListQueryTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.reader = self.create_account('reader')
+        self.category = Category.objects.create(name='History')
+
+        for blog in self.create_blogs(25):
+            # images are attached without going through Image.save,
+            # the list endpoint only needs their names
+            Image.objects.bulk_create([
+                Image(blog=blog, image='images/{}-1.jpg'.format(blog.slug)),
+                Image(blog=blog, image='images/{}-2.jpg'.format(blog.slug)),
+            ])
+            Comment.objects.create(blog=blog, account=self.reader, comment='nice')
+            Like.objects.create(blog=blog, account=self.reader)
+
+    def get_list(self, limit):
+        return self.client.get(reverse('blog-list'), {'limit': limit})
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # conditional GET validators + count + page + images prefetch
+        for limit in (1, 5, 20):
+            with self.assertNumQueries(4):
+                response = self.get_list(limit)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_filtered_query_count_does_not_depend_on_page_size(self):
+        # validators, category id + author id lookups, then count + page + images prefetch
+        url = reverse('blog-list')
+        for limit in (1, 20):
+            with self.assertNumQueries(6):
+                self.client.get(url, {'limit': limit, 'category': 'History', 'username': 'author'})
+
+    def test_unknown_filter_value_skips_the_feed_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('blog-list'), {'category': 'Unknown'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_list_renders_related_data(self):
+        blog = self.get_list(1).data['results'][0]
+        self.assertEqual(blog['author'], self.author.name)
+        self.assertEqual(blog['category'], 'History')
+        self.assertEqual(blog['comment_count'], 1)
+        self.assertEqual(blog['like_count'], 1)
+        self.assertEqual(len(blog['images']), 2)
+
+
+class BlogCounterTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.reader = self.create_account('reader')
+        self.category = Category.objects.create(name='History')
+        self.blog = self.create_blogs(1)[0]
+
+    def refresh_counters(self):
+        self.blog.refresh_from_db(fields=['like_count', 'comment_count'])
+        return self.blog.like_count, self.blog.comment_count
+
+    def test_like_toggle_updates_counter(self):
+        self.client.force_authenticate(self.reader)
+        url = reverse('blog-like', args=[self.blog.slug])
+
+        self.client.post(url)
+        self.assertEqual(self.refresh_counters(), (1, 0))
+        self.client.post(url)
+        self.assertEqual(self.refresh_counters(), (0, 0))
+
+    def test_comment_create_and_delete_update_counter(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(reverse('blog-comment', args=[self.blog.slug]), {'comment': 'nice'})
+        self.assertEqual(self.refresh_counters(), (0, 1))
+
+        Comment.objects.get().delete()
+        self.assertEqual(self.refresh_counters(), (0, 0))
+
+    def test_deleting_account_updates_counters(self):
+        Like.objects.create(blog=self.blog, account=self.reader)
+        Comment.objects.create(blog=self.blog, account=self.reader, comment='nice')
+        self.reader.delete()
+        self.assertEqual(self.refresh_counters(), (0, 0))
+
+    def test_list_does_not_aggregate(self):
+        Like.objects.create(blog=self.blog, account=self.reader)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('blog-list'))
+        self.assertEqual(response.data['results'][0]['like_count'], 1)
+
+    def test_recount_command_repairs_drift(self):
+        Like.objects.create(blog=self.blog, account=self.reader)
+        Comment.objects.create(blog=self.blog, account=self.reader, comment='nice')
+        Blog.objects.update(like_count=7, comment_count=0)
+        untouched = self.create_blogs(1)[0]
+
+        out = StringIO()
+        call_command('recount_blog_counters', stdout=out)
+        self.assertIn('Repaired the counters of 1 blog(s)', out.getvalue())
+        self.assertEqual(self.refresh_counters(), (1, 1))
+        untouched.refresh_from_db()
+        self.assertEqual((untouched.like_count, untouched.comment_count), (0, 0))
+
+
+class BlogCursorPaginationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        self.blogs = self.create_blogs(7)
+
+    def test_limit_offset_is_still_the_default(self):
+        response = self.client.get(reverse('blog-list'), {'limit': 3, 'offset': 3})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_cursor_pages_cover_the_feed_without_counting(self):
+        # validators + page + images prefetch, the pagination doesn't count
+        with self.assertNumQueries(3), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog-list'), {'pagination': 'cursor', 'limit': 3})
+        self.assertEqual(len([query for query in queries if 'COUNT(' in query['sql'].upper()]), 1)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        seen = [blog['id'] for blog in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen += [blog['id'] for blog in response.data['results']]
+            next_url = response.data['next']
+
+        expected = sorted((blog.id for blog in self.blogs), reverse=True)
+        self.assertEqual(seen, expected)
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_cursor_pages_respect_filters(self):
+        other = Category.objects.create(name='Art')
+        self.create_blogs(2, category=other)
+        response = self.client.get(reverse('blog-list'), {'pagination': 'cursor', 'category': 'Art'})
+        self.assertEqual([blog['category'] for blog in response.data['results']], ['Art', 'Art'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'checks the SQLite query plans')
+class BlogFeedQueryPlanTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        self.create_blogs(3)
+
+    def assertRangeScan(self, queryset, table, index):
+        plan = queryset.explain()
+        self.assertIn('SEARCH {} USING INDEX {}'.format(table, index), plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_category_feed_uses_category_index(self):
+        feed = Blog.objects.for_list().for_feed(category='History')[:20]
+        self.assertRangeScan(feed, 'blogs_blog', 'blog_category_pub_date_idx')
+
+    def test_author_feed_uses_author_index(self):
+        feed = Blog.objects.for_list().for_feed(username='author')[:20]
+        self.assertRangeScan(feed, 'blogs_blog', 'blog_author_pub_date_idx')
+
+    def test_combined_feed_uses_a_composite_index(self):
+        plan = Blog.objects.for_list().for_feed(category='History', username='author')[:20].explain()
+        self.assertRegex(plan, r'SEARCH blogs_blog USING INDEX blog_(author|category)_pub_date_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_unfiltered_feed_walks_the_pub_date_index(self):
+        plan = Blog.objects.for_list().for_feed()[:20].explain()
+        self.assertIn('SCAN blogs_blog USING INDEX blog_pub_date_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_blog_comments_use_comment_index(self):
+        comments = Comment.objects.filter(blog_id=1).order_by('commented_at')
+        self.assertRangeScan(comments, 'blogs_comment', 'comment_blog_commented_at_idx')
+
+
+
+class BlogResponseCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.reader = self.create_account('reader')
+        self.category = Category.objects.create(name='History')
+        self.other_category = Category.objects.create(name='Art')
+        self.blog = self.create_blogs(1)[0]
+        self.other_blog = self.create_blogs(1, category=self.other_category)[0]
+
+    def get_feed(self, **params):
+        return self.client.get(reverse('blog-list'), params)
+
+    def get_detail(self, blog):
+        return self.client.get(reverse('blog-detail', args=[blog.slug]))
+
+    def test_anonymous_feed_is_served_from_cache(self):
+        self.get_feed(category='History')
+        with self.assertNumQueries(0):
+            response = self.get_feed(category='History')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_cache_key_depends_on_page(self):
+        self.get_feed(limit=1)
+        response = self.get_feed(limit=1, offset=1)
+        self.assertEqual(response.data['results'][0]['id'], self.blog.id)
+
+    def test_recount_evicts_the_affected_responses(self):
+        Blog.objects.filter(pk=self.blog.pk).update(like_count=7)
+        self.get_feed()
+        self.get_detail(self.blog)
+        Blog.objects.recount()
+        self.assertEqual(self.get_feed().data['results'][-1]['like_count'], 0)
+        self.assertEqual(self.get_detail(self.blog).data['like_count'], 0)
+
+    def test_authenticated_feed_is_not_cached(self):
+        self.client.force_authenticate(self.reader)
+        self.get_feed()
+        with self.assertNumQueries(4):
+            self.get_feed()
+
+    def test_like_evicts_only_the_affected_feeds(self):
+        self.get_feed()
+        self.get_feed(category='History')
+        self.get_feed(category='Art')
+        self.get_detail(self.blog)
+
+        Like.objects.create(blog=self.blog, account=self.reader)
+
+        self.assertEqual(self.get_feed().data['results'][1]['like_count'], 1)
+        self.assertEqual(self.get_feed(category='History').data['results'][0]['like_count'], 1)
+        self.assertEqual(self.get_detail(self.blog).data['like_count'], 1)
+        with self.assertNumQueries(0):
+            self.get_feed(category='Art')
+
+    def test_comment_evicts_the_detail(self):
+        self.get_detail(self.blog)
+        Comment.objects.create(blog=self.blog, account=self.reader, comment='nice')
+        response = self.get_detail(self.blog)
+        self.assertEqual(response.data['comment_count'], 1)
+        self.assertEqual(len(response.data['comments']), 1)
+
+    def test_moving_a_blog_evicts_the_previous_category(self):
+        self.get_feed(category='History')
+        self.blog.category = self.other_category
+        self.blog.save()
+        self.assertEqual(self.get_feed(category='History').data['count'], 0)
+        self.assertEqual(self.get_feed(category='Art').data['count'], 2)
+
+    def test_author_rename_evicts_everything(self):
+        self.get_feed(category='Art')
+        self.author.name = 'Renamed'
+        self.author.save()
+        self.assertEqual(self.get_feed(category='Art').data['results'][0]['author'], 'Renamed')
+
+
+class ConditionalGetTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.reader = self.create_account('reader')
+        self.category = Category.objects.create(name='History')
+        self.blog = self.create_blogs(1)[0]
+
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_feed_etag_changes_with_likes(self):
+        url = reverse('blog-list')
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+        Like.objects.create(blog=self.blog, account=self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_etag_changes_with_deletes(self):
+        self.create_blogs(1)
+        url = reverse('blog-list')
+        etag = self.client.get(url)['ETag']
+        self.blog.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_revalidating_a_cached_feed_costs_no_queries(self):
+        url = reverse('blog-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_authenticated_readers_are_revalidated_too(self):
+        self.client.force_authenticate(self.reader)
+        url = reverse('blog-list')
+        etag = self.client.get(url)['ETag']
+        # validators only, the page isn't rendered
+        with self.assertNumQueries(1):
+            self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_etags_change_with_the_author_and_category_names(self):
+        urls = [reverse('blog-list'), reverse('blog-detail', args=[self.blog.slug])]
+        for rename in (self.author, self.category):
+            etags = [self.client.get(url)['ETag'] for url in urls]
+            rename.name = 'Renamed {}'.format(type(rename).__name__)
+            rename.save()
+            for url, etag in zip(urls, etags):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_feed_etag_changes_with_recounts(self):
+        Blog.objects.filter(pk=self.blog.pk).update(like_count=7)
+        self.client.force_authenticate(self.reader)
+        url = reverse('blog-list')
+        etag = self.client.get(url)['ETag']
+        Blog.objects.recount()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_feed_last_modified(self):
+        url = reverse('blog-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    def test_detail_last_modified(self):
+        url = reverse('blog-detail', args=[self.blog.slug])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    def test_detail_etag_changes_with_comments(self):
+        url = reverse('blog-detail', args=[self.blog.slug])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(blog=self.blog, account=self.reader, comment='nice')
+        self.assertNotEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_category_detail(self):
+        url = reverse('category-detail', args=[self.category.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_category_list_etag_changes_with_new_categories(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+        Category.objects.create(name='Art')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def make_image_file(name='photo.jpg', size=(64, 48), format='JPEG', **params):
+    buffer = BytesIO()
+    PILImage.new('RGB', size, 'red').save(buffer, format, **params)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageTestCase(BlogTestCase):
+    """Stores the uploaded images in a temporary MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_ASYNC=False)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        self.blog = self.create_blogs(1)[0]
+
+
+class ImageProcessingTests(ImageTestCase):
+    def test_inline_processing(self):
+        image = Image.objects.create(blog=self.blog, image=make_image_file())
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.READY)
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_upload_is_processed_after_commit(self):
+        with mock.patch('blogs.tasks.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = Image.objects.create(blog=self.blog, image=make_image_file())
+                # nothing is submitted before the upload commits
+                get_executor.return_value.submit.assert_not_called()
+                self.assertEqual(Image.objects.get().status, Image.PENDING)
+
+        get_executor.return_value.submit.assert_called_once_with(tasks._run_in_worker, image.pk)
+        tasks.process_image(image.pk)
+        self.assertEqual(Image.objects.get().status, Image.READY)
+
+    def test_processing_state_is_exposed(self):
+        with override_settings(IMAGE_PROCESSING_ASYNC=True), self.captureOnCommitCallbacks():
+            Image.objects.create(blog=self.blog, image=make_image_file())
+        response = self.client.get(reverse('blog-detail', args=[self.blog.slug]))
+        self.assertEqual(response.data['images'][0]['status'], Image.PENDING)
+
+    def test_unreadable_upload_fails(self):
+        upload = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('blogs.tasks', 'ERROR'):
+            image = Image.objects.create(blog=self.blog, image=upload)
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.FAILED)
+
+    def test_command_processes_leftover_images(self):
+        with override_settings(IMAGE_PROCESSING_ASYNC=True), self.captureOnCommitCallbacks():
+            Image.objects.create(blog=self.blog, image=make_image_file())
+
+        out = StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn('Processed 1 image(s)', out.getvalue())
+        self.assertEqual(Image.objects.get().status, Image.READY)
+
+
+class ImageVariantTests(ImageTestCase):
+    def test_variants_are_generated_once_processed(self):
+        image = Image.objects.create(blog=self.blog, image=make_image_file(size=(2000, 1200)))
+        image.refresh_from_db()
+
+        self.assertEqual(set(image.variants), {'thumbnail', 'medium', 'large'})
+        for name, size in Image.VARIANT_SIZES:
+            variant = image.variants[name]
+            self.assertLessEqual(max(variant['width'], variant['height']), size)
+            self.assertEqual(PILImage.open(image.image.storage.path(variant['webp'])).format, 'WEBP')
+            self.assertEqual(PILImage.open(image.image.storage.path(variant['jpeg'])).format, 'JPEG')
+
+    def test_original_format_is_kept(self):
+        image = Image.objects.create(blog=self.blog, image=make_image_file('photo.png', format='PNG'))
+        image.refresh_from_db()
+        self.assertEqual(set(image.variants['thumbnail']), {'width', 'height', 'webp', 'png'})
+
+    def test_list_references_small_variants_and_detail_large_ones(self):
+        Image.objects.create(blog=self.blog, image=make_image_file(size=(2000, 1200)))
+
+        srcset = self.client.get(reverse('blog-list')).data['results'][0]['images'][0]['srcset']
+        self.assertEqual(set(srcset), {'thumbnail', 'medium'})
+        self.assertTrue(srcset['thumbnail']['webp'].startswith('http://testserver/media/images/variants/'))
+
+        srcset = self.client.get(reverse('blog-detail', args=[self.blog.slug])).data['images'][0]['srcset']
+        self.assertEqual(set(srcset), {'medium', 'large'})
+
+    def test_command_generates_missing_variants(self):
+        image = Image.objects.create(blog=self.blog, image=make_image_file())
+        Image.objects.update(variants={})
+
+        call_command('process_images', '--missing-variants', stdout=StringIO())
+        image.refresh_from_db()
+        self.assertIn('thumbnail', image.variants)
+
+    def test_command_evicts_the_cached_responses(self):
+        Image.objects.create(blog=self.blog, image=make_image_file())
+        Image.objects.update(variants={})
+        self.assertEqual(self.client.get(reverse('blog-list')).data['results'][0]['images'][0]['srcset'], {})
+
+        call_command('process_images', '--missing-variants', stdout=StringIO())
+        srcset = self.client.get(reverse('blog-list')).data['results'][0]['images'][0]['srcset']
+        self.assertIn('thumbnail', srcset)
+
+
+class ImageDecodingTests(ImageTestCase):
+    def upload(self, **kwargs):
+        image = Image.objects.create(blog=self.blog, image=make_image_file(**kwargs))
+        image.refresh_from_db()
+        return image
+
+    @override_settings(IMAGE_MAX_DIMENSION=500)
+    def test_upload_is_stored_downscaled(self):
+        image = self.upload(size=(3000, 1000))
+        self.assertEqual(image.status, Image.READY)
+        self.assertEqual(PILImage.open(image.image.path).size, (500, 167))
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_upload_above_the_pixel_limit_is_rejected_before_being_stored(self):
+        with self.assertRaises(ValidationError):
+            self.upload(size=(100, 100))
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'images')))
+
+        self.client.force_authenticate(self.author)
+        response = self.client.post(reverse('blog-list'), {
+            'title': 'Large', 'body': 'body', 'category': 'History', 'images': [make_image_file(size=(100, 100))],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds 1000 pixels', str(response.data))
+        self.assertFalse(Blog.objects.filter(title='Large').exists())
+
+    def test_metadata_is_stripped_after_applying_the_orientation(self):
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010f] = 'Camera maker'
+        image = self.upload(size=(60, 40), exif=exif.tobytes())
+
+        stored = PILImage.open(image.image.path)
+        self.assertEqual(stored.size, (40, 60))
+        self.assertEqual(dict(stored.getexif()), {})
+
+
+class BlogLikeTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.reader = self.create_account('reader')
+        self.category = Category.objects.create(name='History')
+        self.blog = self.create_blogs(1)[0]
+        self.url = reverse('blog-like', args=[self.blog.slug])
+        self.client.force_authenticate(self.reader)
+
+    def test_toggle(self):
+        self.assertEqual(self.client.post(self.url).data, {'liked': True, 'like_count': 1})
+        self.assertEqual(self.client.post(self.url).data, {'liked': False, 'like_count': 0})
+
+    def test_put_and_delete_are_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(self.client.put(self.url).data, {'liked': True, 'like_count': 1})
+        for _ in range(2):
+            self.assertEqual(self.client.delete(self.url).data, {'liked': False, 'like_count': 0})
+        self.assertFalse(Like.objects.exists())
+
+    def test_like_racing_a_double_tap(self):
+        # the other request inserted the like between our delete and insert
+        Like.objects.create(blog=self.blog, account=self.reader)
+        with mock.patch.object(LikeQuerySet, 'remove', return_value=False):
+            response = self.client.post(self.url)
+        self.assertEqual(response.data, {'liked': True, 'like_count': 1})
+
+    def test_unknown_blog(self):
+        self.assertEqual(self.client.put(reverse('blog-like', args=['missing'])).status_code, 404)
+
+
+class ConcurrentLikeTests(TransactionTestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.author = Account.objects.create_user(email='author@example.com', username='author', password='x')
+        self.readers = [
+            Account.objects.create_user(email='r{}@example.com'.format(i), username='r{}'.format(i), password='x')
+            for i in range(4)
+        ]
+        self.category = Category.objects.create(name='History')
+        self.blog = Blog.objects.create(title='Blog', body='body', author=self.author, category=self.category)
+
+    def run_concurrently(self, target, args_list):
+        barrier = threading.Barrier(len(args_list))
+        errors = []
+
+        def run(*args):
+            try:
+                barrier.wait()
+                target(*args)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=args) for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def put_like(self, account):
+        client = APIClient()
+        client.force_authenticate(account)
+        response = client.put(reverse('blog-like', args=[self.blog.slug]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_double_taps_like_once(self):
+        self.run_concurrently(self.put_like, [(self.readers[0],)] * 4)
+        self.blog.refresh_from_db()
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(self.blog.like_count, 1)
+
+    def test_concurrent_likes_are_all_counted(self):
+        self.run_concurrently(self.put_like, [(reader,) for reader in self.readers])
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.like_count, len(self.readers))
+
+
+class BlogCommentPaginationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        self.blog = self.create_blogs(1)[0]
+        self.readers = [self.create_account('reader{}'.format(i)) for i in range(3)]
+
+    def add_comments(self, count):
+        for i in range(count):
+            Comment.objects.create(blog=self.blog, account=self.readers[i % 3], comment='comment {}'.format(i))
+
+    def get_detail(self):
+        return self.client.get(reverse('blog-detail', args=[self.blog.slug]))
+
+    def test_detail_embeds_the_first_page(self):
+        self.add_comments(25)
+        data = self.get_detail().data
+        self.assertEqual(len(data['comments']), 20)
+        self.assertEqual(data['comments'][0]['comment'], 'comment 0')
+        self.assertEqual(data['comments'][1]['commented_by'], self.readers[1].name)
+
+        response = self.client.get(data['comments_next'])
+        self.assertEqual(
+            [comment['comment'] for comment in response.data['results']],
+            ['comment {}'.format(i) for i in range(20, 25)])
+        self.assertIsNone(response.data['next'])
+
+    def test_detail_ignores_the_comment_page_params(self):
+        self.add_comments(25)
+        # anonymous, the first response is cached for every reader
+        data = self.client.get(reverse('blog-detail', args=[self.blog.slug]), {'limit': 1}).data
+        self.assertEqual(len(data['comments']), 20)
+        data = self.get_detail().data
+        self.assertEqual(len(data['comments']), 20)
+        self.assertEqual(len(self.client.get(data['comments_next']).data['results']), 5)
+
+    def test_detail_without_more_comments(self):
+        self.add_comments(2)
+        self.assertIsNone(self.get_detail().data['comments_next'])
+
+    def test_detail_query_count_does_not_depend_on_comments(self):
+        # validators + blog + images + comments page
+        for count in (1, 30):
+            self.add_comments(count)
+            cache.get_cache().clear()
+            with self.assertNumQueries(4):
+                self.get_detail()
+
+    def test_comments_endpoint(self):
+        self.add_comments(3)
+        url = reverse('blog-comments', args=[self.blog.slug])
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get(response.data['next']).data['results'][0]['comment'], 'comment 2')
+
+        self.assertEqual(self.client.get(reverse('blog-comments', args=['missing'])).status_code, 404)
+
+
+class BlogWriteTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+
+    def capture_writes(self, func):
+        with CaptureQueriesContext(connection) as context:
+            result = func()
+        # the search index's raw SQL doesn't quote its table
+        writes = [re.match(r'(INSERT INTO|UPDATE|DELETE FROM) "?(\w+)"?', query['sql']) for query in context.captured_queries]
+        return result, [write.groups() for write in writes if write]
+
+    def test_create_writes_the_blog_once(self):
+        blog, writes = self.capture_writes(
+            lambda: Blog.objects.create(title='Hello', body='body', author=self.author, category=self.category))
+        self.assertEqual(writes, [
+            ('INSERT INTO', 'blogs_blog'), ('UPDATE', 'blogs_category'), ('INSERT INTO', 'blogs_blog_fts')])
+        self.assertEqual(blog.slug, 'hello')
+
+    def test_create_through_the_api(self):
+        self.client.force_authenticate(self.author)
+        response, writes = self.capture_writes(lambda: self.client.post(
+            reverse('blog-list'), {'title': 'Hello', 'body': 'body', 'category': 'History'}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(writes, [
+            ('INSERT INTO', 'blogs_blog'), ('UPDATE', 'blogs_category'), ('INSERT INTO', 'blogs_blog_fts')])
+
+    def test_create_bumps_the_category(self):
+        before = self.category.modified_at
+        self.create_blogs(1)
+        self.category.refresh_from_db()
+        self.assertGreater(self.category.modified_at, before)
+
+    def test_duplicate_titles_get_numbered_slugs(self):
+        slugs = [blog.slug for blog in self.create_blogs(1) + self.create_blogs(1) + self.create_blogs(1)]
+        self.assertEqual(slugs, ['blog-0', 'blog-0-2', 'blog-0-3'])
+
+
+
+class SlugAllocationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+
+    def create_blog(self, title):
+        return Blog.objects.create(title=title, body='body', author=self.author, category=self.category)
+
+    def test_allocation_is_a_single_query(self):
+        for _ in range(5):
+            self.create_blog('Hello')
+        with self.assertNumQueries(1):
+            slug = unique_slug_generator(Blog(title='Hello'))
+        self.assertEqual(slug, 'hello-6')
+
+    def test_similar_slugs_are_not_counted(self):
+        self.create_blog('Hello')
+        self.create_blog('Hello 3')
+        self.create_blog('Hello world')
+        self.assertEqual(self.create_blog('Hello').slug, 'hello-2')
+        self.assertEqual(self.create_blog('Hello').slug, 'hello-4')
+
+    def test_short_slugs_read_only_their_numbered_variants(self):
+        for title in ('The', 'The', 'The end', 'The 2 towers', 'Theory'):
+            self.create_blog(title)
+        self.assertEqual(taken_slugs(Blog, 'the', 100), {'the', 'the-2'})
+        self.assertEqual(self.create_blog('The').slug, 'the-3')
+
+    def test_first_free_number_is_used(self):
+        blogs = [self.create_blog('Hello') for _ in range(3)]
+        blogs[1].delete()
+        self.assertEqual(self.create_blog('Hello').slug, 'hello-2')
+
+    def test_long_titles_are_truncated(self):
+        title = 'a' * 150
+        self.assertEqual(self.create_blog(title).slug, 'a' * 100)
+        self.assertEqual(self.create_blog(title).slug, 'a' * 98 + '-2')
+        self.assertEqual(self.create_blog(title).slug, 'a' * 98 + '-3')
+        # no hyphen is left dangling before the suffix
+        self.create_blog('word ' * 40)
+        self.assertNotIn('--', self.create_blog('word ' * 40).slug)
+
+    def test_title_without_slug_characters(self):
+        self.assertEqual(self.create_blog('!!!').slug, 'blog')
+        self.assertEqual(self.create_blog('???').slug, 'blog-2')
+
+    def test_conflicting_insert_is_retried(self):
+        self.create_blog('Hello')
+        # a concurrent post took the slug after it was allocated
+        with mock.patch('blogs.models.unique_slug_generator', side_effect=['hello', 'hello-2']):
+            blog = self.create_blog('Hello')
+        self.assertEqual(blog.slug, 'hello-2')
+
+
+class FastJSONTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+
+    def test_output_matches_json_renderer(self):
+        self.create_blogs(3)
+        response = self.client.get(reverse('blog-list'))
+        data = dict(response.data, extra={
+            'at': timezone.now(), 'price': Decimal('1.50'), 'lazy': gettext_lazy('Hello'),
+            'id': uuid.uuid4(), 'text': 'line\u2028separator', 1: 'key',
+        })
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch('config.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indented_responses_fall_back(self):
+        data = {'a': [1, 2]}
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_api_renders_and_parses_json(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            reverse('blog-list'), {'title': 'Héllo', 'body': 'body', 'category': 'History'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['title'], 'Héllo')
+
+        response = self.client.post(reverse('blog-list'), '{"title":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class SparseFieldsetTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        for blog in self.create_blogs(3):
+            Image.objects.bulk_create([Image(blog=blog, image='images/{}.jpg'.format(blog.slug))])
+            Blog.objects.filter(pk=blog.pk).update(body='<p>Long   body</p> ' * 100)
+        Blog.objects.update(excerpt='teaser')
+
+    def get_list(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('blog-list'), params)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_default_fields_are_unchanged(self):
+        response, _ = self.get_list()
+        self.assertEqual(
+            list(response.data['results'][0]),
+            ['id', 'slug', 'category', 'title', 'author', 'pub_date', 'body', 'images', 'comment_count', 'like_count'])
+
+    def test_excerpt_mode_skips_the_body(self):
+        response, queries = self.get_list(excerpt='true')
+        blog = response.data['results'][0]
+        self.assertEqual(blog['excerpt'], 'teaser')
+        self.assertNotIn('body', blog)
+        self.assertFalse(any('"blogs_blog"."body"' in sql for sql in queries))
+
+    def test_selected_fields_only(self):
+        response, queries = self.get_list(fields='id,title')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title'])
+        # neither the text columns nor the images are loaded
+        self.assertFalse(any('"blogs_blog"."body"' in sql or 'blogs_image' in sql for sql in queries))
+
+    def test_excluded_fields(self):
+        response, _ = self.get_list(exclude='body,images')
+        self.assertNotIn('body', response.data['results'][0])
+        self.assertNotIn('images', response.data['results'][0])
+        self.assertIn('title', response.data['results'][0])
+
+    def test_unknown_fields_are_rejected(self):
+        response, _ = self.get_list(fields='id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Unknown fields: password'})
+
+    def test_fieldsets_are_cached_apart(self):
+        self.get_list()
+        response, _ = self.get_list(excerpt='true')
+        self.assertIn('excerpt', response.data['results'][0])
+
+    def test_excerpt_follows_the_body(self):
+        blog = Blog.objects.first()
+        blog.body = '<p>New <b>body</b></p>\n\n' + 'word ' * 100
+        blog.save(update_fields=['body'])
+        blog.refresh_from_db()
+        self.assertTrue(blog.excerpt.startswith('New body word'))
+        self.assertLessEqual(len(blog.excerpt), 300)
+        self.assertTrue(blog.excerpt.endswith('word…'))
+
+
+class BlogSearchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        # flushes of the TransactionTestCases leave the index behind
+        search.get_backend().rebuild()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+
+    def create_blog(self, title, body):
+        return Blog.objects.create(title=title, body=body, author=self.author, category=self.category)
+
+    def search(self, q, **params):
+        return self.client.get(reverse('blog-search'), {'q': q, **params})
+
+    def test_title_matches_rank_first(self):
+        self.create_blog('Temples of Patan', 'A walk around the old city.')
+        self.create_blog('Old cities', 'The temples of Bhaktapur were rebuilt.')
+        self.create_blog('Mountains', 'Nothing to see here.')
+
+        response = self.search('temples')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([blog['title'] for blog in response.data['results']], ['Temples of Patan', 'Old cities'])
+        self.assertGreater(response.data['results'][0]['search']['rank'], response.data['results'][1]['search']['rank'])
+        self.assertIn('excerpt', response.data['results'][0])
+
+    def test_every_word_must_match_and_the_last_is_a_prefix(self):
+        self.create_blog('Patan durbar square', 'body')
+        self.create_blog('Patan museum', 'body')
+        response = self.search('patan squ')
+        self.assertEqual([blog['title'] for blog in response.data['results']], ['Patan durbar square'])
+
+    def test_highlights_are_escaped(self):
+        self.create_blog('<b>Temples</b> & shrines', '<script>alert(1)</script> the temples of Patan')
+        result = self.search('temples').data['results'][0]['search']
+        self.assertEqual(result['title'], '&lt;b&gt;<mark>Temples</mark>&lt;/b&gt; &amp; shrines')
+        self.assertIn('<mark>temples</mark> of Patan', result['snippet'])
+        self.assertNotIn('<script>', result['snippet'])
+
+    def test_index_follows_updates_and_deletes(self):
+        blog = self.create_blog('Temples', 'body')
+        blog.title = 'Mountains'
+        blog.save()
+        self.assertEqual(self.search('temples').data['count'], 0)
+        self.assertEqual(self.search('mountains').data['count'], 1)
+
+        blog.delete()
+        self.assertEqual(self.search('mountains').data['count'], 0)
+
+    def test_pagination(self):
+        for i in range(5):
+            self.create_blog('Temple {}'.format(i), 'body')
+        response = self.search('temple', limit=2)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('offset=2', response.data['next'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.create_blog('Temples', 'body')
+        for q in ('"temples', 'temples OR', 'title:temples', '(*)'):
+            self.assertEqual(self.search(q).status_code, 200, q)
+        self.assertEqual(self.search('*').data['count'], 0)
+
+    def test_missing_query(self):
+        response = self.client.get(reverse('blog-search'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_scan_backend_matches_the_same_blogs(self):
+        self.create_blog('Temples of Patan', 'A walk around the old city.')
+        self.create_blog('Old cities', 'The temples of Bhaktapur were rebuilt.')
+        self.create_blog('Mountains', 'Nothing to see here.')
+        backend = search.ScanSearchBackend()
+        hits = search.SearchResults('temple', backend)
+        self.assertEqual(hits.count(), 2)
+        self.assertEqual({hit.title for hit in hits[0:20]}, {'<mark>Temples</mark> of Patan', 'Old cities'})
+
+
+class AsyncViewTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_account()
+        self.category = Category.objects.create(name='History')
+        self.blogs = self.create_blogs(3)
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view, request, **kwargs):
+        response = await view.as_view()(request, **kwargs)
+        # rendered by the handler when served
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def authorization(self, account):
+        # AsyncRequestFactory takes headers, not META keys
+        return {'headers': {'Authorization': 'Bearer {}'.format(RefreshToken.for_user(account).access_token)}}
+
+    async def test_list_matches_the_drf_view(self):
+        response = await self.call(async_views.BlogListView, self.factory.get('/blogs/', {'limit': 2}))
+        expected = await sync_to_async(self.client.get)(reverse('blog-list'), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_detail_answers_conditional_requests(self):
+        view = async_views.BlogDetailView
+        response = await self.call(view, self.factory.get('/'), slug=self.blogs[0].slug)
+        self.assertEqual(json.loads(response.content)['title'], self.blogs[0].title)
+
+        response = await self.call(view, self.factory.get('/', headers={'If-None-Match': response['ETag']}), slug=self.blogs[0].slug)
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.call(view, self.factory.get('/'), slug='missing')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_like_authenticates_with_the_token(self):
+        view = async_views.BlogLikeView
+        response = await self.call(view, self.factory.put('/'), slug=self.blogs[0].slug)
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.call(view, self.factory.put('/', **self.authorization(self.author)), slug=self.blogs[0].slug)
+        self.assertEqual(json.loads(response.content), {'liked': True, 'like_count': 1})
+
+    async def test_writes_are_handed_to_the_drf_view(self):
+        request = self.factory.post(
+            '/blogs/', {'title': 'Hello', 'body': 'body', 'category': 'History'},
+            content_type='application/json', **self.authorization(self.author))
+        response = await self.call(async_views.BlogListView, request)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Blog.objects.filter(slug='hello').aexists())
@@ -1,27 +1,33 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import (
-    BlogListView,
-    BlogDetailView,
-    BlogLikeView,
-    BlogCommentView,
-    CategoryViewSet
-)
+from . import async_views, views
+from .views import BlogSearchView, CategoryViewSet
+
+# under ASGI the read, like and comment endpoints are served by native
+# async views, see blogs/async_views.py
+endpoints = async_views if getattr(settings, 'ASYNC_BLOG_VIEWS', False) else views
 
 
 urlpatterns = [
     # listing all the blogs
-    path('', BlogListView.as_view(), name='blog-list'),
+    path('', endpoints.BlogListView.as_view(), name='blog-list'),
+
+    # full-text search, ?q=
+    path('search/', BlogSearchView.as_view(), name='blog-search'),
 
     # detail view of a blog
-    path('b/<slug:slug>/', BlogDetailView.as_view(), name='blog-detail'),
+    path('b/<slug:slug>/', endpoints.BlogDetailView.as_view(), name='blog-detail'),
 
     # liking a blog
-    path('b/<slug:slug>/like/', BlogLikeView.as_view(), name='blog-like'),
+    path('b/<slug:slug>/like/', endpoints.BlogLikeView.as_view(), name='blog-like'),
 
     # commenting on a blog
-    path('b/<slug:slug>/comment/', BlogCommentView.as_view(), name='blog-comment'),
+    path('b/<slug:slug>/comment/', endpoints.BlogCommentView.as_view(), name='blog-comment'),
+
+    # paginated comments of a blog
+    path('b/<slug:slug>/comments/', endpoints.BlogCommentListView.as_view(), name='blog-comments'),
 ]
 
 router = DefaultRouter()
@@ -1,15 +1,68 @@
-from django.utils.text import slugify 
-
-def unique_slug_generator(instance, new_slug = None): 
-    if new_slug is not None: 
-        slug = new_slug 
-    else: 
-        slug = slugify(instance.title) 
-    Klass = instance.__class__ 
-    qs_exists = Klass.objects.filter(slug = slug).exists() 
-    if qs_exists: 
-        new_slug = "{slug}-{blog_id}".format( 
-            slug = slug, blog_id = instance.id) 
-              
-        return unique_slug_generator(instance, new_slug = new_slug) 
-    return slug 
\ No newline at end of file
+import re
+
+from django.db.models import Q
+from django.utils.html import strip_tags
+from django.utils.text import slugify
+
+# characters of the body stored as the excerpt of the blogs
+EXCERPT_LENGTH = 300
+
+# room kept for the "-<number>" suffix when matching the taken slugs
+MAX_SUFFIX_LENGTH = 11
+
+
+def numbered_slug(slug, number, max_length):
+    if number == 1:
+        return slug[:max_length]
+    suffix = '-{}'.format(number)
+    return slug[:max_length - len(suffix)].rstrip('-') + suffix
+
+
+def taken_slugs(Klass, slug, max_length):
+    """The slug and its numbered variants already taken."""
+    if len(slug) <= max_length - MAX_SUFFIX_LENGTH:
+        # the numbered variants are slug-<number>, the range scan on the
+        # prefix is narrowed to them so a short slug ("the") doesn't read
+        # every slug starting with it
+        variants = Q(slug__startswith=slug + '-', slug__regex=r'^{}-[0-9]+$'.format(re.escape(slug)))
+        queryset = Klass.objects.filter(Q(slug=slug) | variants)
+    else:
+        # truncated to fit the suffix, every variant starts with this prefix
+        prefix = slug[:max_length - MAX_SUFFIX_LENGTH].rstrip('-')
+        queryset = Klass.objects.filter(slug__startswith=prefix)
+    return set(queryset.values_list('slug', flat=True))
+
+
+def unique_slug_generator(instance):
+    """
+    Allocate a free slug for ``instance`` from its title.
+
+    Duplicates are numbered (title, title-2, title-3...) and truncated to
+    fit the slug field. The taken slugs are read with a single query and
+    the first free number is picked from them.
+    """
+    Klass = instance.__class__
+    max_length = Klass._meta.get_field('slug').max_length
+    slug = slugify(instance.title)[:max_length].strip('-') or Klass._meta.model_name
+
+    taken = taken_slugs(Klass, slug, max_length)
+    if slug not in taken:
+        return slug
+
+    # the lowest free number, like the titles ending with a number
+    # ("Hello 2023") the numbered slugs can't be told apart from
+    number = 2
+    while numbered_slug(slug, number, max_length) in taken:
+        number += 1
+    return numbered_slug(slug, number, max_length)
+
+
+def make_excerpt(body, length=EXCERPT_LENGTH):
+    # plain text on a single line, cut at a word boundary
+    text = ' '.join(strip_tags(body).split())
+    if len(text) <= length:
+        return text
+    text = text[:length + 1]
+    if ' ' in text:
+        text = text.rsplit(' ', 1)[0]
+    return text[:length - 1].rstrip(' .,;:') + '…'
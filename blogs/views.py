@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -8,7 +9,16 @@ from rest_framework import viewsets
 
 from .models import Blog, Category, Comment, Like
 from .serializers import BlogListSerializer, BlogDetailSerializer, CommentSerializer, CategorySerializer
-from .paginations import CustomLimitOffsetPagination
+from .paginations import CustomLimitOffsetPagination, BlogCursorPagination, CommentCursorPagination
+from . import cache
+from .search import SearchResults
+from .conditional import (
+    conditional,
+    blog_list_validators,
+    blog_detail_validators,
+    category_list_validators,
+    category_detail_validators,
+)
 
 # Customizing the permissions model
 SAFE_METHODS = ['GET', 'HEAD', 'OPTIONS']
@@ -30,23 +40,50 @@ class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    @conditional(category_list_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(category_detail_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 class BlogListView(APIView, CustomLimitOffsetPagination):
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(blog_list_validators)
     def get(self, request, *args, **kwargs):
+        # serving anonymous readers from the response cache
+        cache_key = cache.feed_cache_key(request) if cache.is_cacheable(request) else None
+        if cache_key:
+            data = cache.get_response_data(cache_key)
+            if data is not None:
+                return Response(data)
+
+        # sparse fieldsets, ?fields=id,title&exclude=...&excerpt=true
+        try:
+            fields = BlogListSerializer.select_fields(
+                request.query_params.get('fields'),
+                request.query_params.get('exclude'),
+                request.query_params.get('excerpt') in ('1', 'true'),
+            )
+        except ValueError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
         category = request.query_params.get('category', None)
         username = request.query_params.get('username', None)
-        if category and username:
-            queryset = Blog.objects.filter(category__name=category, author__username=username)
-        elif category:
-            queryset = Blog.objects.filter(category__name=category)
-        elif username:
-            queryset = Blog.objects.filter(author__username=username)
-        else:
-            queryset = Blog.objects.all()
-        blogs = self.paginate_queryset(queryset, request, view=self)
-        serializer = BlogListSerializer(blogs, many=True, context={'request': request})
-        return self.get_paginated_response(serializer.data)
+        queryset = Blog.objects.for_list().for_feed(category=category, username=username)
+        # the long text columns are only loaded when returned
+        queryset = queryset.defer(*[name for name in ('body', 'excerpt') if name not in fields])
+        if 'images' not in fields:
+            queryset = queryset.prefetch_related(None)
+        paginator = self.get_paginator(request)
+        blogs = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = BlogListSerializer(blogs, many=True, fields=fields, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        if cache_key:
+            cache.set_response_data(cache_key, response.data)
+        return response
 
         # if category:
         #     blogs = Blog.objects.filter(category__name=category)
@@ -57,6 +94,13 @@ class BlogListView(APIView, CustomLimitOffsetPagination):
         
         # return self.get_paginated_response(serializer.data)
 
+    # limit/offset stays the default for old clients,
+    # the feed opts into cursor pagination with ?pagination=cursor
+    def get_paginator(self, request):
+        if BlogCursorPagination.is_requested(request):
+            return BlogCursorPagination()
+        return self
+
     def post(self, request):
         serializer = BlogDetailSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -70,16 +114,26 @@ class BlogListView(APIView, CustomLimitOffsetPagination):
 class BlogDetailView(APIView):
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(blog_detail_validators)
     def get(self, request, slug):
+        # serving anonymous readers from the response cache
+        cache_key = cache.detail_cache_key(request, slug) if cache.is_cacheable(request) else None
+        if cache_key:
+            data = cache.get_response_data(cache_key)
+            if data is not None:
+                return Response(data)
+
         # getting the blog instance from the slug
         # if the blog is not found, raise an exception
         try:
-            blog = Blog.objects.get(slug=slug)
+            blog = Blog.objects.for_list().get(slug=slug)
         except Blog.DoesNotExist:
             return Response(
                 {'error': 'Blog with slug {} does not exist'.format(slug)},
                 status=status.HTTP_404_NOT_FOUND)
         serializer = BlogDetailSerializer(blog, context={'request': request})
+        if cache_key:
+            cache.set_response_data(cache_key, serializer.data)
         return Response(serializer.data)
 
         # view to update the blog
@@ -129,36 +183,102 @@ class BlogDetailView(APIView):
 
 
 
+def change_like(blog_id, account, liked=None):
+    """
+    Toggle the like of ``account`` when ``liked`` is None, otherwise like or
+    unlike the blog. Returns whether the blog is liked and its like count.
+    """
+    with transaction.atomic():
+        if liked is None:
+            liked = Like.objects.toggle(blog_id, account)
+        elif liked:
+            Like.objects.add(blog_id, account)
+        else:
+            Like.objects.remove(blog_id, account)
+        like_count = Blog.objects.filter(pk=blog_id).values_list('like_count', flat=True).get()
+    return liked, like_count
+
+
 class BlogLikeView(APIView):
     permission_classes = (IsAuthenticated,)
 
+    # POST toggles the like, PUT likes and DELETE unlikes the blog;
+    # the like and the blog's like_count change in one transaction
     def post(self, request, slug):
-        # getting the blog from the slug
+        return self.change_like(request, slug)
+
+    def put(self, request, slug):
+        return self.change_like(request, slug, liked=True)
+
+    def delete(self, request, slug):
+        return self.change_like(request, slug, liked=False)
+
+    def change_like(self, request, slug, liked=None):
+        # getting the blog id from the slug
         # raising an exception if the blog does not exist
-        try:
-            blog = Blog.objects.get(slug=slug)
-        except Blog.DoesNotExist:
+        blog_id = Blog.objects.filter(slug=slug).values_list('id', flat=True).first()
+        if blog_id is None:
             return Response(
                 {'error': 'Blog with slug {} does not exist'.format(slug)},
                 status=status.HTTP_404_NOT_FOUND)
 
-        # checking if the user has already liked the blog
-        # disliking the blog if the user has already liked it
-        if Like.objects.filter(blog=blog, account=request.user).exists():
-            like = Like.objects.get(blog=blog, account=request.user)
-            like.delete()
-            return Response(
-                {'liked': False},
-                status=status.HTTP_200_OK)
-
-        # liking the blog if the user has not liked it yet
-        like = Like.objects.create(blog=blog, account=request.user)
-        like.save()
+        liked, like_count = change_like(blog_id, request.user, liked)
         return Response(
-            {'liked': True},
+            {'liked': liked, 'like_count': like_count},
             status=status.HTTP_200_OK)
 
 
+class BlogSearchView(APIView, CustomLimitOffsetPagination):
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Missing search query'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # the results show the excerpt unless ?excerpt=false
+        try:
+            fields = BlogListSerializer.select_fields(
+                request.query_params.get('fields'),
+                request.query_params.get('exclude'),
+                request.query_params.get('excerpt', 'true') in ('1', 'true'),
+            )
+        except ValueError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ranked hits from the search index, then their blogs in one query
+        hits = self.paginate_queryset(SearchResults(query), request, view=self)
+        queryset = Blog.objects.for_list().defer(*[name for name in ('body', 'excerpt') if name not in fields])
+        blogs = queryset.in_bulk([hit.blog_id for hit in hits])
+        hits = [hit for hit in hits if hit.blog_id in blogs]
+
+        serializer = BlogListSerializer(
+            [blogs[hit.blog_id] for hit in hits], many=True, fields=fields, context={'request': request})
+        results = serializer.data
+        for data, hit in zip(results, hits):
+            data['search'] = {'rank': hit.rank, 'title': hit.title, 'snippet': hit.snippet}
+        return self.get_paginated_response(results)
+
+
+class BlogCommentListView(APIView):
+    permission_classes = (AllowAny,)
+
+    def get(self, request, slug):
+        # getting the blog id from the slug
+        # raising an exception if the blog does not exist
+        blog_id = Blog.objects.filter(slug=slug).values_list('id', flat=True).first()
+        if blog_id is None:
+            return Response(
+                {'error': 'Blog with slug {} does not exist'.format(slug)},
+                status=status.HTTP_404_NOT_FOUND)
+
+        paginator = CommentCursorPagination()
+        comments = paginator.paginate_queryset(
+            Comment.objects.filter(blog_id=blog_id).select_related('account'), request, view=self)
+        serializer = CommentSerializer(comments, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 class BlogCommentView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -177,7 +297,9 @@ class BlogCommentView(APIView):
         
         # checking if the serializer is valid
         if serializer.is_valid():
-            serializer.save(blog=blog, account=request.user)
+            # saving the comment and bumping the blog's comment_count atomically
+            with transaction.atomic():
+                serializer.save(blog=blog, account=request.user)
             return Response(serializer.data)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 
     'blogs',
     'accounts',
+    'core',
     
     'rest_framework',
     'corsheaders',
@@ -34,6 +35,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # queries and time of the requests, reported at /stats/requests/
+    'core.middleware.MetricsMiddleware',
+
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
@@ -48,6 +52,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+
+    # reads of the safe requests to the replicas, see core/routers.py
+    'core.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -74,17 +81,43 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# connections are kept DB_CONN_MAX_AGE seconds and pinged before being
+# reused by a request. DB_POOL_SIZE > 0 hands them to an in-process pool
+# instead, returning them at the end of every request (see core/backends)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'mysql.connector.django',
+        'ENGINE': 'core.backends.mysql' if DB_POOL_SIZE else 'mysql.connector.django',
         'NAME': 'yatharup_digital_museum',
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': 'localhost',
         'PORT': '3306',
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {'SIZE': DB_POOL_SIZE, 'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '5'))},
     }
 }
 
+# read replicas of the default database, DB_REPLICA_HOSTS=host[:port],...
+for number, address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.strip().partition(':')
+    DATABASES['replica_{}'.format(number)] = {**DATABASES['default'], 'HOST': host, 'PORT': port or '3306'}
+
+# the reads of the safe requests to the REPLICA_URL_NAMES views go to one of
+# DATABASE_REPLICAS. A user that wrote reads from the primary for
+# REPLICA_STICKY_SECONDS, enough for the replicas to catch up. The deadline
+# is kept in the default cache, which the processes must share
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+REPLICA_URL_NAMES = ('blog-list', 'blog-detail', 'category-list', 'category-detail', 'account')
+REPLICA_STICKY_SECONDS = 5
+
+# the request metrics of core/metrics.py are also sent to the clients in
+# Server-Timing headers
+SERVER_TIMING = True
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -130,8 +163,40 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Cache used for the public blog responses (see blogs/cache.py).
+# locmem is per process, point BLOG_CACHE_ALIAS at a shared backend
+# (memcached, redis) so invalidations reach every worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+BLOG_CACHE_ALIAS = 'default'
+BLOG_CACHE_TIMEOUT = 300
+
+
+# serve the blog read, like and comment endpoints with native async views,
+# for deployments running config.asgi (see blogs/async_views.py)
+ASYNC_BLOG_VIEWS = os.getenv('ASYNC_BLOG_VIEWS', 'false').lower() == 'true'
+
+
+# Uploaded blog images are compressed by a background thread pool once
+# the request commits, set IMAGE_PROCESSING_ASYNC = False to process inline
+IMAGE_PROCESSING_ASYNC = True
+IMAGE_PROCESSING_WORKERS = 2
+# uploads above IMAGE_MAX_PIXELS are rejected from their header before being
+# stored, the others are stored downscaled to fit in IMAGE_MAX_DIMENSION
+# and without metadata
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_MAX_DIMENSION = 2048
+
+
 # model to use for user authentication
 AUTH_USER_MODEL = 'accounts.Account'
+# log in with the email or the username
+AUTHENTICATION_BACKENDS = ['accounts.backends.EmailBackend']
+# seconds during which further logins don't write last_login again
+LAST_LOGIN_UPDATE_INTERVAL = 600
 
 # List of the authentication classes
 REST_FRAMEWORK = {
@@ -139,8 +204,18 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),  
+    # orjson backed JSON, falling back to DRF's when it isn't installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 
     # configuration of pagination
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
@@ -166,6 +241,14 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# accounts authenticated by the JWTs are cached by every process for
+# JWT_PRINCIPAL_CACHE_TTL seconds (see accounts/authentication.py)
+JWT_PRINCIPAL_CACHE_SIZE = 1024
+JWT_PRINCIPAL_CACHE_TTL = 60
+# trust the account fields embedded in the access tokens instead, read again
+# on every refresh, deactivations then apply once the access tokens expire
+JWT_EMBED_PRINCIPAL = False
+
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ORIGIN_WHITELIST = (
@@ -188,6 +271,15 @@ DEFAULT_FROM_EMAIL = 'noreply@yatharup.com'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
+# OTP emails are stored in an outbox and sent by a background thread once
+# the request commits, set EMAIL_OUTBOX_ASYNC = False to send inline
+EMAIL_OUTBOX_ASYNC = True
+EMAIL_OUTBOX_BATCH_SIZE = 50
+# failed sends are retried after EMAIL_OUTBOX_RETRY_DELAY seconds, doubled
+# on every attempt, until EMAIL_OUTBOX_MAX_ATTEMPTS
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+
 
 # Override production variables if DJANGO_DEVELOPMENT env variable is set
 # if os.getenv('DJANGO_DEVELOPMENT_MODE'):
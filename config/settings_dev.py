@@ -10,10 +10,35 @@ ALLOWED_HOSTS = ["*"]
 DEBUG = True
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 with transaction_mode, see core/backends
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a file instead of the shared in-memory database, so the tests
+        # running requests from several threads wait on locks
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        # writes take the lock upfront and wait on busy_timeout for it
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
+# a second SQLite file standing in for a read replica, used when
+# DB_REPLICA_NAME is set; copy db.sqlite3 to it to replicate
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.getenv('DB_REPLICA_NAME', BASE_DIR / 'db_replica.sqlite3'),
+    'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+}
+DATABASE_REPLICAS = ['replica'] if os.getenv('DB_REPLICA_NAME') else []
+# applied to every SQLite connection, see core/sqlite.py
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
+}
 SIMPLE_JWT = {
     # 'ACCESS_TOKEN_LIFETIME': timedelta(minutes=130),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=365),
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        # connecting the connection counters, the SQLite tuning and the
+        # query counter of the request metrics
+        from . import connections, metrics, sqlite  # noqa: F401
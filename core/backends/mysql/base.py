@@ -0,0 +1,104 @@
+"""
+mysql.connector.django with an in-process pool of connections.
+
+Configured with the POOL key of the database settings:
+
+    'POOL': {'SIZE': 10, 'TIMEOUT': 5}
+
+Closing a connection, at the end of every request with CONN_MAX_AGE = 0,
+hands it back to the pool, which resets its session and pings it before
+the next checkout, discarding the broken ones. Checkouts wait TIMEOUT
+seconds for a connection once the SIZE connections are taken.
+"""
+
+import threading
+from collections import deque
+
+import mysql.connector
+from mysql.connector.django.base import DatabaseWrapper as MySQLDatabaseWrapper, DjangoMySQLConverter
+from mysql.connector.errors import Error, PoolError
+from mysql.connector.pooling import CNX_POOL_MAXSIZE
+
+from core.connections import stats
+
+# pools of the process, by alias and database (the test database gets its own)
+pools = {}
+pools_lock = threading.Lock()
+
+
+class Pool:
+    """
+    At most ``size`` connections, opened by ``connect`` when no idle one is
+    left and handed out by checkout() until they are given back by checkin().
+    """
+
+    def __init__(self, alias, size, connect):
+        self.alias = alias
+        self.connect = connect
+        self.slots = threading.BoundedSemaphore(size)
+        # appends and pops are atomic, the slots bound the length
+        self.idle = deque()
+
+    def checkout(self, timeout):
+        if not self.slots.acquire(blocking=False):
+            stats.incr(self.alias, 'pool_waits')
+            if not self.slots.acquire(timeout=timeout):
+                raise PoolError('Failed getting connection; pool exhausted')
+        try:
+            while self.idle:
+                connection = self.idle.pop()
+                # pings the server
+                if self.is_usable(connection):
+                    return connection
+                self.discard(connection)
+            connection = self.connect()
+            stats.incr(self.alias, 'pooled')
+            return connection
+        except Exception:
+            self.slots.release()
+            raise
+
+    def checkin(self, connection):
+        try:
+            # rolls back and clears the session state, like a new connection
+            connection.reset_session()
+        except Error:
+            self.discard(connection)
+        else:
+            self.idle.append(connection)
+        finally:
+            self.slots.release()
+
+    def is_usable(self, connection):
+        try:
+            return connection.is_connected()
+        except Error:
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    def get_pool(self, conn_params):
+        key = (self.alias, conn_params.get('database'))
+        with pools_lock:
+            if key not in pools:
+                size = self.settings_dict.get('POOL', {}).get('SIZE', CNX_POOL_MAXSIZE)
+                pools[key] = Pool(self.alias, size, lambda: mysql.connector.connect(**conn_params))
+            return pools[key]
+
+    def get_new_connection(self, conn_params):
+        conn_params.setdefault('converter_class', DjangoMySQLConverter)
+        timeout = self.settings_dict.get('POOL', {}).get('TIMEOUT', 5)
+        self.pool = self.get_pool(conn_params)
+        return self.pool.checkout(timeout)
+
+    def _close(self):
+        # returns the connection to the pool instead of closing it
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,37 @@
+"""
+Django's SQLite backend with the transaction_mode option of Django 5.1:
+
+    'OPTIONS': {'transaction_mode': 'IMMEDIATE'}
+
+Transactions are DEFERRED by default. One reading before it writes can't
+wait on busy_timeout to upgrade its lock and fails at once with 'database
+is locked' when another connection writes. IMMEDIATE transactions take the
+write lock at BEGIN, waiting for it.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(SQLiteDatabaseWrapper):
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                'settings.DATABASES[{!r}]["OPTIONS"]["transaction_mode"] is improperly configured '
+                'to {!r}. Use one of {}, or None.'.format(self.alias, mode, ', '.join(TRANSACTION_MODES)))
+        return mode and mode.upper()
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # not an argument of sqlite3.connect()
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+        self.cursor().execute('BEGIN {}'.format(self.transaction_mode))
@@ -0,0 +1,44 @@
+"""
+Helpers of the bench_* management commands.
+
+A BenchCommand runs bench() inside a transaction rolled back at the end,
+so the rows created to measure never stay in the database.
+"""
+
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries, see connection.execute_wrapper()."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def rolled_back():
+    # nested in another one, only rolls back to its savepoint
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+class BenchCommand(BaseCommand):
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.description = '{}, inside a rolled back transaction'.format(self.help)
+        return parser
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.bench(*args, **options)
+
+    def bench(self, *args, **options):
+        raise NotImplementedError('subclasses of BenchCommand must provide a bench() method')
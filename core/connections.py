@@ -0,0 +1,69 @@
+"""
+Counters of the database connections opened and reused by this process.
+
+    opened      connections opened by Django (checked out, when pooled)
+    reused      requests started on a connection kept from a previous one
+    pooled      connections opened by the pool of core.backends.mysql
+    pool_waits  checkouts that waited for a connection to come back
+
+With persistent connections (CONN_MAX_AGE) the hit ratio is reused over
+reused + opened, with the pool it is 1 - pooled / opened.
+"""
+
+import threading
+from collections import Counter, defaultdict
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+COUNTERS = ('opened', 'reused', 'pooled', 'pool_waits')
+
+
+def hit_ratio(opened, reused, pooled, **kwargs):
+    if pooled:
+        # the pool opens a connection only when none is idle
+        return max(1 - pooled / opened, 0) if opened else None
+    served = opened + reused
+    return reused / served if served else None
+
+
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(Counter)
+
+    def incr(self, alias, name, count=1):
+        with self.lock:
+            self.counters[alias][name] += count
+
+    def snapshot(self):
+        with self.lock:
+            counters = {alias: dict(counter) for alias, counter in self.counters.items()}
+        stats = {}
+        for alias, counter in counters.items():
+            stats[alias] = {name: counter.get(name, 0) for name in COUNTERS}
+            stats[alias]['hit_ratio'] = hit_ratio(**stats[alias])
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+
+
+stats = ConnectionStats()
+
+
+@receiver(connection_created)
+def count_opened(sender, connection, **kwargs):
+    stats.incr(connection.alias, 'opened')
+
+
+# connected after close_old_connections, so only the connections it kept
+# are counted
+@receiver(request_started)
+def count_reused(sender, **kwargs):
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            stats.incr(connection.alias, 'reused')
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.test import RequestFactory
+
+from accounts.models import Account
+from blogs.models import Blog, Category, Comment
+from blogs.serializers import BlogListSerializer
+from blogs.views import change_like
+
+PREFIX = 'bench-sqlite'
+
+# PRAGMAs (None for SQLITE_PRAGMAS) and transaction_mode of each profile,
+# Django's defaults being a rollback journal and deferred transactions
+PROFILES = {
+    'default': ({'journal_mode': 'delete', 'synchronous': 'full'}, None),
+    'pragmas': (None, None),
+    'tuned': (None, 'IMMEDIATE'),
+}
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)] if timings else 0
+
+
+class Command(BaseCommand):
+    help = 'Mixed like and comment writes against feed reads from several threads, per SQLite profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=300, help='operations of each thread')
+        parser.add_argument('--writes', type=float, default=0.3, help='share of the operations writing')
+        parser.add_argument('--blogs', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write('bench_sqlite runs against a SQLite database')
+            return
+
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+        database_options = connection.settings_dict['OPTIONS']
+        transaction_mode = database_options.get('transaction_mode')
+        blog_ids, accounts = self.create_data(options['blogs'], options['threads'])
+        try:
+            self.stdout.write('{:>8} {:>8} {:>8} {:>8} {:>10} {:>10}'.format(
+                'profile', 'ops/s', 'reads/s', 'writes/s', 'locked', 'p99 (ms)'))
+            for name, (profile, mode) in PROFILES.items():
+                settings.SQLITE_PRAGMAS = pragmas if profile is None else profile
+                # shared by the connections of every thread
+                database_options['transaction_mode'] = mode
+                # reopening, the journal mode is kept by the database file
+                connection.close()
+                connection.ensure_connection()
+                result = self.run(blog_ids, accounts, options)
+                self.stdout.write('{:>8} {:>8.0f} {:>8.0f} {:>8.0f} {:>10} {:>10.2f}'.format(name, *result))
+        finally:
+            settings.SQLITE_PRAGMAS = pragmas
+            database_options['transaction_mode'] = transaction_mode
+            connection.close()
+            Blog.objects.filter(title__startswith=PREFIX).delete()
+            Account.objects.filter(username__startswith=PREFIX).delete()
+
+    def create_data(self, count, threads):
+        author, _ = Account.objects.get_or_create(email='{}@example.com'.format(PREFIX), username=PREFIX)
+        category, _ = Category.objects.get_or_create(name=PREFIX)
+        blog_ids = [
+            Blog.objects.create(author=author, category=category, title='{} {}'.format(PREFIX, i),
+                                body='<p>{}</p>'.format('body ' * 200)).pk
+            for i in range(count)
+        ]
+        accounts = [
+            Account.objects.get_or_create(
+                email='{}-{}@example.com'.format(PREFIX, i), username='{}-{}'.format(PREFIX, i))[0]
+            for i in range(threads)
+        ]
+        return blog_ids, accounts
+
+    def run(self, blog_ids, accounts, options):
+        request = RequestFactory().get('/blogs/', HTTP_HOST='localhost')
+        timings = {'read': [], 'write': []}
+        locked = []
+        lock = threading.Lock()
+
+        def work(account, seed):
+            rng = random.Random(seed)
+            results = {'read': [], 'write': []}
+            errors = 0
+            try:
+                for _ in range(options['operations']):
+                    kind = 'write' if rng.random() < options['writes'] else 'read'
+                    start = time.perf_counter()
+                    try:
+                        if kind == 'read':
+                            blogs = Blog.objects.for_list().for_feed()[:20]
+                            BlogListSerializer(blogs, many=True, context={'request': request}).data
+                        elif rng.random() < 0.5:
+                            change_like(rng.choice(blog_ids), account)
+                        else:
+                            with transaction.atomic():
+                                Comment.objects.create(blog_id=rng.choice(blog_ids), account=account, comment='bench')
+                    except OperationalError:
+                        # database is locked
+                        errors += 1
+                        continue
+                    results[kind].append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                timings['read'] += results['read']
+                timings['write'] += results['write']
+                locked.append(errors)
+
+        threads = [threading.Thread(target=work, args=(account, i)) for i, account in enumerate(accounts)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        reads, writes = len(timings['read']), len(timings['write'])
+        return (
+            (reads + writes) / elapsed, reads / elapsed, writes / elapsed,
+            sum(locked), percentile(timings['read'] + timings['write'], 0.99) * 1000,
+        )
@@ -0,0 +1,178 @@
+"""
+Cost of the requests, per URL name (blog-list, token_create...):
+
+    queries      SQL queries executed
+    db           milliseconds spent executing them
+    serializer   milliseconds spent in the .data of the serializers using
+                 TimedSerializerMixin, including the queries they trigger
+    total        milliseconds from the first middleware to the response
+
+MetricsMiddleware measures every request, adds a Server-Timing header and
+aggregates the measures in the histograms of this process, reported by
+/stats/requests/. The queries are counted by an execute wrapper installed
+on every connection, and the serializers timed by TimedSerializerMixin,
+both doing nothing outside requests.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import ListSerializer
+
+# upper bounds of the buckets, the last one catching the rest
+MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf'))
+METRICS = {'queries': QUERY_BUCKETS, 'db': MS_BUCKETS, 'serializer': MS_BUCKETS, 'total': MS_BUCKETS}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        # the upper bound of the bucket holding the quantile
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            # cumulative, like Prometheus
+            'buckets': {
+                str(bound): sum(self.counts[:index + 1]) for index, bound in enumerate(self.buckets)
+            },
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def record(self, name, measures):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = {metric: Histogram(buckets) for metric, buckets in METRICS.items()}
+            for metric, value in measures.items():
+                self.histograms[name][metric].observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {metric: histogram.as_dict() for metric, histogram in histograms.items()}
+                for name, histograms in self.histograms.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0
+        self.serializer = 0
+        # nested serializers are timed by the outermost one
+        self.serializing = False
+
+    def measures(self):
+        return {
+            'queries': self.queries,
+            'db': self.db * 1000,
+            'serializer': self.serializer * 1000,
+            'total': (time.perf_counter() - self.start) * 1000,
+        }
+
+
+# metrics of the request being served, None outside requests
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db += time.perf_counter() - start
+        metrics.queries += 1
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    # first, execute_wrapper() blocks pop the last wrapper on exit
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+@contextmanager
+def timed_serialization():
+    metrics = current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer += time.perf_counter() - start
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """
+    Times .data in the request metrics, the many=True lists included: the
+    subclasses' Meta.list_serializer_class is replaced by a timed subclass.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if issubclass(cls, ListSerializer):
+            return
+        meta = getattr(cls, 'Meta', None)
+        if meta is None:
+            meta = cls.Meta = type('Meta', (), {})
+        list_serializer_class = getattr(meta, 'list_serializer_class', ListSerializer)
+        if not issubclass(list_serializer_class, TimedSerializerMixin):
+            meta.list_serializer_class = type(
+                'Timed' + list_serializer_class.__name__, (TimedSerializerMixin, list_serializer_class), {})
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+def server_timing(measures):
+    return 'db;dur={:.1f};desc="{} queries", serializer;dur={:.1f}, total;dur={:.1f}'.format(
+        measures['db'], measures['queries'], measures['serializer'], measures['total'])
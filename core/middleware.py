@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import RequestMetrics, current, registry, server_timing
+from .routers import RoutingState, pick_replica, routing
+
+# the time until which the client reads from the primary, kept in the
+# shared cache for the authenticated users and in a cookie for the others
+STICKY_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def sticky_key(user_id):
+    return 'replica:primary_until:{}'.format(user_id)
+
+
+def get_user_id(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    # DRF authenticates the bearer tokens in the view, after process_view
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except InvalidToken:
+        return None
+
+
+def is_sticky(request):
+    user_id = get_user_id(request)
+    until = cache.get(sticky_key(user_id)) if user_id is not None else request.COOKIES.get(STICKY_COOKIE)
+    try:
+        return float(until or 0) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """
+    Sends the reads of the safe requests to the REPLICA_URL_NAMES views to
+    a read replica, unless the user or client wrote in the last
+    REPLICA_STICKY_SECONDS. See core/routers.py.
+    """
+
+    def process_request(self, request):
+        routing.set(RoutingState())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and request.resolver_match.url_name in getattr(settings, 'REPLICA_URL_NAMES', ())
+            and not is_sticky(request)
+        ):
+            routing.get().replica = pick_replica()
+
+    def process_response(self, request, response):
+        state = routing.get()
+        if state is not None and state.wrote:
+            seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            until = time.time() + seconds
+            # the API's clients send bearer tokens from other origins, not cookies
+            user_id = get_user_id(request)
+            if user_id is not None:
+                cache.set(sticky_key(user_id), until, seconds)
+            else:
+                response.set_cookie(STICKY_COOKIE, str(until), max_age=seconds, httponly=True, samesite='Lax')
+        # the context outlives the request in the threads of WSGI servers
+        routing.set(None)
+        return response
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Measures the queries, DB, serializer and total time of the requests, in
+    the Server-Timing header and the histograms of core/metrics.py. First
+    in MIDDLEWARE, so the total covers the other middleware.
+    """
+
+    def process_request(self, request):
+        current.set(RequestMetrics())
+
+    def process_response(self, request, response):
+        metrics = current.get()
+        if metrics is None:
+            return response
+        current.set(None)
+
+        measures = metrics.measures()
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(measures)
+        match = getattr(request, 'resolver_match', None)
+        # unmatched paths share one name, not to grow the histograms
+        registry.record(match.view_name if match else '<unmatched>', measures)
+        return response
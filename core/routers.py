@@ -0,0 +1,66 @@
+"""
+Routing of the reads to the read replicas.
+
+The reads of the safe requests to the views in REPLICA_URL_NAMES go to one
+of DATABASE_REPLICAS, picked per request by ReplicaMiddleware. Everything
+else, writes, other views and the work outside requests, uses the primary
+(default) database.
+
+A write pins the rest of the request to the primary, and the middleware
+keeps the user's reads on it for REPLICA_STICKY_SECONDS afterwards, so
+users read their own writes despite the replication lag. Other users may
+read stale rows in that time. The responses built from them are cached for
+at most REPLICA_STICKY_SECONDS (see blogs.cache.get_timeout()), so a stale
+entry doesn't outlive the lag.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+
+class RoutingState:
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+# state of the request being served, None outside requests
+routing = contextvars.ContextVar('routing', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pick_replica():
+    replicas = get_replicas()
+    return random.choice(replicas) if replicas else None
+
+
+def reads_from_replica():
+    state = routing.get()
+    return state is not None and bool(state.replica) and not state.wrote
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return routing.get().replica
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {PRIMARY, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
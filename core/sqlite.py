@@ -0,0 +1,38 @@
+"""
+Tuning profile of the SQLite connections, the PRAGMAs of SQLITE_PRAGMAS
+applied to every connection Django opens:
+
+    journal_mode=wal      readers no longer block on a writer, nor it on them
+    synchronous=normal    fsync at checkpoints instead of every commit, safe
+                          with WAL (a power loss may drop the last commits)
+    busy_timeout          milliseconds a writer waits for the lock before
+                          'database is locked'
+    cache_size            page cache, in KiB when negative
+    mmap_size             bytes of the file read through mmap
+    temp_store=memory     temporary tables and indices in memory
+"""
+
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragma_statements(pragmas):
+    statements = []
+    for name, value in pragmas.items():
+        # the PRAGMAs can't take parameters
+        if not re.fullmatch(r'\w+', name) or not re.fullmatch(r'-?\w+', str(value)):
+            raise ImproperlyConfigured('Invalid SQLite PRAGMA {}={!r}'.format(name, value))
+        statements.append('PRAGMA {}={}'.format(name, value))
+    return statements
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for statement in pragma_statements(getattr(settings, 'SQLITE_PRAGMAS', {})):
+        connection.connection.execute(statement)
@@ -0,0 +1,325 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.core.cache import cache as django_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from mysql.connector.errors import InterfaceError, PoolError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Account
+from blogs import cache
+from blogs.models import Category
+from .backends.mysql.base import Pool
+from .backends.sqlite3.base import DatabaseWrapper
+from .connections import hit_ratio, stats
+from .metrics import QUERY_BUCKETS, Histogram, RequestMetrics, TimedSerializerMixin, current, registry
+from .middleware import STICKY_COOKIE, sticky_key
+from .routers import PRIMARY, PrimaryReplicaRouter, RoutingState, routing
+from .sqlite import pragma_statements
+
+
+class ConnectionStatsTests(TestCase):
+    def setUp(self):
+        stats.clear()
+        self.client = APIClient()
+
+    def test_counts_the_connections_opened(self):
+        connection = connections.create_connection('default')
+        connection.ensure_connection()
+        connection.close()
+        self.assertEqual(stats.snapshot()['default']['opened'], 1)
+
+    def test_counts_the_requests_on_a_kept_connection(self):
+        connections['default'].ensure_connection()
+        self.client.get(reverse('blog-list'))
+        self.client.get(reverse('blog-list'))
+        self.assertEqual(stats.snapshot()['default']['reused'], 2)
+        self.assertEqual(stats.snapshot()['default']['hit_ratio'], 1)
+
+    def test_hit_ratio(self):
+        self.assertEqual(hit_ratio(opened=1, reused=3, pooled=0), 0.75)
+        self.assertIsNone(hit_ratio(opened=0, reused=0, pooled=0))
+        # 8 connections served 40 checkouts
+        self.assertEqual(hit_ratio(opened=40, reused=0, pooled=8), 0.8)
+
+    def test_stats_are_admin_only(self):
+        url = reverse('connection-stats')
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        account = Account.objects.create_user(email='reader@example.com', username='reader', password='password')
+        self.client.force_authenticate(account)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        account.is_staff = True
+        account.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('reused', response.data['default'])
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.resets = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def reset_session(self):
+        if not self.connected:
+            raise InterfaceError('Connection lost')
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        stats.clear()
+        self.opened = []
+        self.pool = Pool('pooled', 1, self.connect)
+
+    def connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def test_connections_are_reused(self):
+        first = self.pool.checkout(timeout=1)
+        self.pool.checkin(first)
+        self.assertIs(self.pool.checkout(timeout=1), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(first.resets, 1)
+        self.assertEqual(stats.snapshot()['pooled']['pooled'], 1)
+
+    def test_checkouts_wait_for_a_connection_to_come_back(self):
+        taken = self.pool.checkout(timeout=1)
+        with self.assertRaises(PoolError):
+            self.pool.checkout(timeout=0.01)
+
+        checked_out = []
+        waiter = threading.Thread(target=lambda: checked_out.append(self.pool.checkout(timeout=5)))
+        waiter.start()
+        waiter.join(0.05)
+        self.assertTrue(waiter.is_alive())
+        self.pool.checkin(taken)
+        waiter.join()
+        self.assertEqual(checked_out, [taken])
+        self.assertEqual(stats.snapshot()['pooled']['pool_waits'], 2)
+
+    def test_broken_connections_are_discarded(self):
+        broken = self.pool.checkout(timeout=1)
+        self.pool.checkin(broken)
+        broken.connected = False
+        replacement = self.pool.checkout(timeout=1)
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+
+        # broken while checked out, its slot is freed all the same
+        replacement.connected = False
+        self.pool.checkin(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(len(self.opened), 2)
+        self.pool.checkout(timeout=0.01)
+        self.assertEqual(len(self.opened), 3)
+
+
+class SQLiteTuningTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # a database of its own, the test transaction holds the lock of the
+        # test database
+        self.connection = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3')}, alias='tuning')
+        self.addCleanup(self.connection.close)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute('PRAGMA {}'.format(name))
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'busy_timeout': 2500, 'temp_store': 'memory'})
+    def test_pragmas_are_applied_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 2500)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_pragmas_are_validated(self):
+        self.assertEqual(pragma_statements({'cache_size': -2000}), ['PRAGMA cache_size=-2000'])
+        with self.assertRaises(ImproperlyConfigured):
+            pragma_statements({'journal_mode': 'wal; DROP TABLE blogs_blog'})
+
+    def test_transactions_take_the_write_lock_upfront(self):
+        self.connection.settings_dict['OPTIONS'] = {'transaction_mode': 'immediate'}
+        self.connection.ensure_connection()
+        with CaptureQueriesContext(self.connection) as queries:
+            self.connection._start_transaction_under_autocommit()
+        self.connection.connection.rollback()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+        self.connection.settings_dict['OPTIONS'] = {'transaction_mode': 'later'}
+        with self.assertRaises(ImproperlyConfigured):
+            self.connection._start_transaction_under_autocommit()
+
+
+# the replica is a second SQLite database, written to directly by the tests
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        django_cache.clear()
+        self.client = APIClient()
+        Category.objects.create(name='Primary')
+        Category.objects.using('replica').create(name='Replica')
+
+    def category_names(self):
+        return [category['name'] for category in self.client.get(reverse('category-list')).data]
+
+    def test_listed_views_read_from_the_replica(self):
+        self.assertEqual(self.category_names(), ['Replica'])
+        # unlisted views and the work outside requests use the primary
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Primary'])
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Category), PRIMARY)
+
+    def test_writers_read_from_the_primary_for_a_while(self):
+        account = Account.objects.create_user(email='admin@example.com', username='admin', password='password')
+        account.is_staff = True
+        account.save()
+        # the API's clients send bearer tokens, and no cookies
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(AccessToken.for_user(account)))
+
+        response = self.client.post(reverse('category-list'), {'name': 'History'})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.category_names(), ['History', 'Primary'])
+
+        django_cache.delete(sticky_key(account.pk))
+        self.assertEqual(self.category_names(), ['Replica'])
+
+    def test_anonymous_clients_are_kept_on_the_primary_by_a_cookie(self):
+        self.client.cookies[STICKY_COOKIE] = str(time.time() + 5)
+        self.assertEqual(self.category_names(), ['Primary'])
+        self.client.cookies[STICKY_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.category_names(), ['Replica'])
+
+    @override_settings(BLOG_CACHE_TIMEOUT=300, REPLICA_STICKY_SECONDS=5)
+    def test_responses_read_from_the_replica_are_cached_briefly(self):
+        cache.get_cache().clear()
+        self.client.get(reverse('blog-list'))
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client.get(reverse('blog-list'))
+        self.assertFalse(queries)
+
+        token = routing.set(RoutingState('replica'))
+        try:
+            self.assertEqual(cache.get_timeout(), 5)
+        finally:
+            routing.reset(token)
+        self.assertEqual(cache.get_timeout(), 300)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_reads_from_the_primary(self):
+        self.assertEqual(self.category_names(), ['Primary'])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.client = APIClient()
+        Category.objects.create(name='History')
+
+    def test_requests_are_measured(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('category-list'))
+        # counted before the next request resets the query log
+        count = len(queries)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="{} queries", serializer;dur=[\d.]+, total;dur=[\d.]+$'.format(count))
+
+        self.client.get(reverse('category-list'))
+        histograms = registry.snapshot()['category-list']
+        self.assertEqual(histograms['queries']['count'], 2)
+        self.assertEqual(histograms['queries']['p50'], count)
+        self.assertGreater(histograms['total']['mean'], 0)
+
+    def test_nested_serializers_are_timed_once(self):
+        from blogs.serializers import CategorySerializer
+
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            CategorySerializer(Category.objects.all(), many=True).data
+        finally:
+            current.reset(token)
+        self.assertGreater(metrics.serializer, 0)
+        self.assertFalse(metrics.serializing)
+
+    def test_lists_are_timed_by_the_mixin_alone(self):
+        from rest_framework import serializers
+
+        class CustomListSerializer(serializers.ListSerializer):
+            pass
+
+        class WithoutMeta(TimedSerializerMixin, serializers.Serializer):
+            name = serializers.CharField()
+
+        class WithListClass(TimedSerializerMixin, serializers.Serializer):
+            name = serializers.CharField()
+
+            class Meta:
+                list_serializer_class = CustomListSerializer
+
+        for serializer_class in (WithoutMeta, WithListClass):
+            metrics = RequestMetrics()
+            token = current.set(metrics)
+            try:
+                serializer = serializer_class([{'name': 'timed'}], many=True)
+                serializer.data
+            finally:
+                current.reset(token)
+            self.assertGreater(metrics.serializer, 0)
+        self.assertIsInstance(serializer, CustomListSerializer)
+
+    def test_only_the_timed_serializers_are_timed(self):
+        from rest_framework import serializers
+
+        class PlainSerializer(serializers.Serializer):
+            name = serializers.CharField()
+
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            PlainSerializer({'name': 'plain'}).data
+        finally:
+            current.reset(token)
+        self.assertEqual(metrics.serializer, 0)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(QUERY_BUCKETS)
+        for queries in (1, 1, 2, 3, 40):
+            histogram.observe(queries)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(0.99), 50)
+        self.assertEqual(histogram.as_dict()['buckets']['inf'], 5)
+
+    def test_metrics_are_admin_only(self):
+        url = reverse('request-metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        account = Account.objects.create_user(email='admin@example.com', username='admin', password='password')
+        account.is_staff = True
+        account.save()
+        self.client.force_authenticate(account)
+        self.client.get(reverse('category-list'))
+        self.assertIn('category-list', self.client.get(url).data)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    # database connections opened and reused by the process
+    path('connections/', views.ConnectionStatsView.as_view(), name='connection-stats'),
+
+    # queries, DB, serializer and total time of the requests, by URL name
+    path('requests/', views.RequestMetricsView.as_view(), name='request-metrics'),
+]
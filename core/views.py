@@ -0,0 +1,24 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .connections import stats
+from .metrics import registry
+
+
+class ConnectionStatsView(APIView):
+    """Database connections opened and reused by this process."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(stats.snapshot())
+
+
+class RequestMetricsView(APIView):
+    """Histograms of the cost of the requests served by this process, by URL name."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(registry.snapshot())